@@ -0,0 +1,196 @@
+"""
+Async (ASGI) serving mode for the translation API.
+
+Serves the same /translate, /translate/batch, /supported_langs, /model_stats and /metrics contract
+as the Flask app in main.py, but connections are handled on an event loop instead of one thread
+each. Inference runs on two bounded thread pools: short texts and long texts get separate lanes,
+so a few slow long texts cannot hold up short requests, and /health never waits for inference.
+A single-text request only uses a lane to look up the translation memory and queue its text on
+the pair's micro-batcher; it then awaits the batch on the event loop, so batches are not capped by
+the number of lane threads. Decoding is bounded by the batcher threads (one per pair and tier).
+
+Run with:
+    python asgi_app.py
+
+    INFERENCE_WORKERS          Threads for short texts (default 4).
+    LONG_INFERENCE_WORKERS     Threads for long texts (default 2).
+    LONG_TEXT_TOKENS           Estimated tokens above which a request uses the long lane (default 256).
+    ASGI_HOST / ASGI_PORT      Listen address (default 0.0.0.0:5000).
+    KEEP_ALIVE_TIMEOUT         Seconds an idle keep-alive connection stays open (default 75).
+    GRACEFUL_SHUTDOWN_TIMEOUT  Seconds to let in-flight requests finish on shutdown (default 60).
+    MAX_CONNECTIONS            Concurrent connections before new ones get 503 (default 1000).
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import main
+import metrics
+from batcher import count_tokens
+from decoding_tiers import resolve_tier
+
+LONG_TEXT_TOKENS = int(os.getenv("LONG_TEXT_TOKENS", "256"))
+
+short_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("INFERENCE_WORKERS", "4")), thread_name_prefix="inference"
+)
+long_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("LONG_INFERENCE_WORKERS", "2")), thread_name_prefix="inference-long"
+)
+
+
+async def run_inference(tokens, func, *args):
+    """Run a blocking inference call on the lane matching its size."""
+    executor = long_executor if tokens > LONG_TEXT_TOKENS else short_executor
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+
+async def translate_one(text, source_lang, target_lang, tier):
+    """Translate one text, awaiting its micro-batch instead of blocking a lane thread on it."""
+    tokens = count_tokens(text)
+    future = await run_inference(
+        tokens, main.submit_translation, text, source_lang, target_lang, tier
+    )
+    if future is None:
+        return await run_inference(
+            tokens, main.translate_with_timing, text, source_lang, target_lang, tier
+        )
+    return await asyncio.wrap_future(future)
+
+
+async def iter_translation_stream(text, source_lang, target_lang, stream_format, tier):
+    # Each batch is decoded on the inference lanes; events go out as soon as it finishes
+    count = 0
+    try:
+        for batch in main.split_stream_batches(text):
+            events = await run_inference(
+                sum(count_tokens(sentence) for _, sentence, _ in batch),
+                main.translate_stream_batch,
+                batch,
+                source_lang,
+                target_lang,
+                tier,
+            )
+            for event in events:
+                count += 1
+                yield main.format_stream_event(event, stream_format)
+        yield main.format_stream_event({"done": True, "count": count}, stream_format)
+    except Exception as e:
+        yield main.format_stream_event({"error": str(e)}, stream_format)
+
+
+async def translate(request):
+    try:
+        data = {}
+        if request.method == "GET":
+            original_text = request.query_params.get("text", "Please input some text")
+            source_lang = request.query_params.get("source_lang", "en")
+            target_lang = request.query_params.get("target_lang", "vi")
+        else:  # POST
+            data = await request.json()
+            original_text = data.get("text", "")
+            source_lang = data.get("source_lang", "en")
+            target_lang = data.get("target_lang", "vi")
+        try:
+            tier = resolve_tier(request.query_params.get("tier", data.get("tier")))
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+
+        if str(request.query_params.get("stream", data.get("stream", ""))).lower() in ("1", "true"):
+            stream_format = request.query_params.get("format", data.get("format", "ndjson"))
+            if stream_format not in main.STREAM_MIMETYPES:
+                return JSONResponse({"error": f"Unknown stream format '{stream_format}'"}, status_code=400)
+            return StreamingResponse(
+                iter_translation_stream(
+                    original_text, source_lang, target_lang, stream_format, tier
+                ),
+                media_type=main.STREAM_MIMETYPES[stream_format],
+            )
+
+        translated_text = await translate_one(original_text, source_lang, target_lang, tier)
+        return JSONResponse(
+            {
+                "original_text": original_text,
+                "source_lang": source_lang,
+                "target_lang": target_lang,
+                "tier": tier,
+                "translated_text": translated_text,
+            }
+        )
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def translate_batch(request):
+    try:
+        try:
+            items = main.parse_batch_items(await request.json())
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        tokens = sum(count_tokens(item["text"]) for item in items)
+        # Checking the limits tokenizes the items, so it runs on a lane too
+        error = await run_inference(tokens, main.check_batch_limits, items)
+        if error:
+            return JSONResponse({"error": error}, status_code=413)
+        results = await run_inference(tokens, main.translate_batch_items, items)
+        return JSONResponse({"results": results})
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def fetch_supported_langs(request):
+    return JSONResponse(main.SUPPORTED_LANGUAGES)
+
+
+async def fetch_model_stats(request):
+    return JSONResponse(main.model_stats())
+
+
+async def fetch_metrics(request):
+    body, content_type = metrics.latest()
+    return Response(body, media_type=content_type)
+
+
+async def health(request):
+    return JSONResponse({"status": "ok"})
+
+
+def shutdown():
+    # Let queued inference finish, then stop the per-pair batching threads and shard workers
+    short_executor.shutdown(wait=True)
+    long_executor.shutdown(wait=True)
+    main.scheduler.stop()
+    main.stop_router()
+
+
+app = Starlette(
+    routes=[
+        Route("/translate", translate, methods=["GET", "POST"]),
+        Route("/translate/batch", translate_batch, methods=["POST"]),
+        Route("/supported_langs", fetch_supported_langs, methods=["GET"]),
+        Route("/model_stats", fetch_model_stats, methods=["GET"]),
+        Route("/metrics", fetch_metrics, methods=["GET"]),
+        Route("/health", health, methods=["GET"]),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+    on_shutdown=[shutdown],
+)
+
+
+if __name__ == "__main__":
+    uvicorn.run(
+        app,
+        host=os.getenv("ASGI_HOST", "0.0.0.0"),
+        port=int(os.getenv("ASGI_PORT", "5000")),
+        timeout_keep_alive=int(os.getenv("KEEP_ALIVE_TIMEOUT", "75")),
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "60")),
+        limit_concurrency=int(os.getenv("MAX_CONNECTIONS", "1000")),
+    )
@@ -0,0 +1,241 @@
+"""
+Dynamic micro-batching for translation requests.
+
+Concurrent callers submit single texts; a background thread per language pair collects requests
+that arrive within a short wait window (bounded by a maximum batch size and token budget), runs
+them through one batched translate call and hands each caller its own result.
+
+Batching is tuned with environment variables, optionally overridden per pair by suffixing the
+pair in upper case, e.g. BATCH_MAX_WAIT_MS_EN_VI=2:
+
+    BATCH_MAX_WAIT_MS   How long to wait for more requests after the first one (default 5).
+    BATCH_MAX_SIZE      Maximum number of texts per batch (default 32).
+    BATCH_MAX_TOKENS    Maximum number of source tokens per batch, 0 for no limit (default 0).
+"""
+
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+_STOP = object()
+
+# Scripts written without spaces between words: each character is roughly one token
+_UNSPACED_CHARS = re.compile(r"[\u0e00-\u0e7f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+# Upper bound on characters per token, so long runs without spaces still count
+_MAX_CHARS_PER_TOKEN = 8
+
+
+def count_tokens(text):
+    """
+    Cheap token estimate used when no tokenizer is at hand (request lanes, default batch budget).
+
+    Whitespace-separated words, plus one token per Chinese, Japanese or Thai character, and at
+    least one token per _MAX_CHARS_PER_TOKEN characters.
+    """
+    unspaced = len(_UNSPACED_CHARS.findall(text))
+    words = len(_UNSPACED_CHARS.sub(" ", text).split()) if unspaced else len(text.split())
+    return max(words + unspaced, len(text) // _MAX_CHARS_PER_TOKEN)
+
+
+def batch_setting(name, pair, default):
+    """
+    Read a batching setting for a pair, falling back to the global value and then the default.
+
+    Args:
+        name (str): Setting name such as "BATCH_MAX_SIZE".
+        pair (str): Language pair such as "en-vi".
+        default (float): Value used when neither variable is set.
+
+    Returns:
+        float: The setting value.
+    """
+    pair_suffix = pair.upper().replace("-", "_").replace(":", "_")
+    value = os.getenv(f"{name}_{pair_suffix}", os.getenv(name))
+    return float(value) if value else default
+
+
+class MicroBatcher:
+    """
+    Collect concurrent single-text requests into batches for one translate function.
+
+    Args:
+        translate_batch (callable): Function taking a list of texts and returning translations.
+        max_wait_ms (float): Time to wait for further requests once one has arrived.
+        max_batch_size (int): Maximum number of texts per batch.
+        max_batch_tokens (int): Maximum source tokens per batch, 0 for no limit.
+        token_counter (callable): Function returning the token count of a text; only called when
+            max_batch_tokens is set.
+        name (str): Pair (or routing key) used to label the batch metrics.
+    """
+
+    def __init__(
+        self,
+        translate_batch,
+        max_wait_ms=5,
+        max_batch_size=32,
+        max_batch_tokens=0,
+        token_counter=count_tokens,
+        name="",
+    ):
+        self.translate_batch = translate_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = int(max_batch_size)
+        self.max_batch_tokens = int(max_batch_tokens)
+        self.token_counter = token_counter
+        self.name = name
+        self._queue = queue.Queue()
+        self._carry = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, text):
+        """
+        Queue a text for translation.
+
+        Args:
+            text (str): Text to translate.
+
+        Returns:
+            Future: Resolves to the translated text.
+        """
+        future = Future()
+        self._queue.put((text, future, time.monotonic()))
+        return future
+
+    def translate(self, text):
+        """Translate a single text, blocking until its batch has finished."""
+        return self.submit(text).result()
+
+    def stop(self):
+        """Finish the queued requests and stop the worker thread."""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _next_item(self, timeout=None):
+        if self._carry is not None:
+            item, self._carry = self._carry, None
+            return item
+        return self._queue.get(timeout=timeout)
+
+    def _collect(self):
+        first = self._next_item()
+        if first is _STOP:
+            return None
+        batch = [first]
+        # Counting tokens costs a tokenizer call per text, so it only runs when a limit is set
+        tokens = self.token_counter(first[0]) if self.max_batch_tokens else 0
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # After the window closes, still take whatever is already queued
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._carry = _STOP
+                break
+            if self.max_batch_tokens:
+                item_tokens = self.token_counter(item[0])
+                if tokens + item_tokens > self.max_batch_tokens:
+                    self._carry = item
+                    break
+                tokens += item_tokens
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            texts = [text for text, _, _ in batch]
+            started = time.monotonic()
+            metrics.record_batch(
+                self.name,
+                len(batch),
+                self.max_batch_size,
+                [started - enqueued for _, _, enqueued in batch],
+            )
+            try:
+                results = list(self.translate_batch(texts))
+                if len(results) != len(batch):
+                    # Outputs cannot be matched to requests; fail them all rather than leave some hanging
+                    raise RuntimeError(
+                        f"Batch translation returned {len(results)} results for {len(batch)} texts"
+                    )
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+
+class BatchScheduler:
+    """
+    Keep one MicroBatcher per language pair and decoding tier, created on first use with that
+    pair's settings. Requests of different tiers decode with different options, so they are never
+    batched together, but they share the pair's settings and metric labels.
+    """
+
+    def __init__(self):
+        self._batchers = {}
+        self._lock = threading.Lock()
+
+    def get(self, pair, translate_batch, tier=None, token_counter=count_tokens):
+        """
+        Return the batcher for a pair and tier.
+
+        Args:
+            pair (str): Language pair (or any routing key) the batcher serves.
+            translate_batch (callable): Batched translate function used when creating the batcher.
+            tier (str): Decoding tier the batcher's requests share.
+            token_counter (callable): Token count of a text for BATCH_MAX_TOKENS, used when
+                creating the batcher (e.g. the model's tokenizer).
+
+        Returns:
+            MicroBatcher: The batcher.
+        """
+        with self._lock:
+            batcher = self._batchers.get((pair, tier))
+            if batcher is None:
+                batcher = MicroBatcher(
+                    translate_batch,
+                    max_wait_ms=batch_setting("BATCH_MAX_WAIT_MS", pair, 5),
+                    max_batch_size=batch_setting("BATCH_MAX_SIZE", pair, 32),
+                    max_batch_tokens=batch_setting("BATCH_MAX_TOKENS", pair, 0),
+                    token_counter=token_counter,
+                    name=pair,
+                )
+                self._batchers[(pair, tier)] = batcher
+        return batcher
+
+    def submit(self, pair, text, translate_batch, tier=None, token_counter=count_tokens):
+        """Queue one text on the pair's batcher and return its Future."""
+        return self.get(pair, translate_batch, tier, token_counter).submit(text)
+
+    def translate(self, pair, text, translate_batch, tier=None):
+        """Translate one text through the pair's batcher."""
+        return self.submit(pair, text, translate_batch, tier).result()
+
+    def stop(self):
+        """Stop every batcher after draining its queue."""
+        with self._lock:
+            batchers = list(self._batchers.values())
+            self._batchers.clear()
+        for batcher in batchers:
+            batcher.stop()
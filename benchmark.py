@@ -0,0 +1,246 @@
+"""
+Throughput and latency benchmark for the translation models.
+
+Drives the same decode path as translate_with_timing (a resident translator's generate call) over a
+fixed corpus, sweeping language pairs, input lengths, batch sizes, beam sizes and compute types, and
+writes one JSON report per run so results can be compared over time. Each case reports sentences/s,
+tokens/s, p50/p95/p99 batch latency and the peak RSS of the process so far.
+
+The corpus is sampled from merged_sentences_*.txt (see merge_sentences.py) or from --corpus, and
+falls back to the fixed calibration sentences in inference_config. Everything runs from local
+model directories, so the benchmark works offline; on a CPU-only machine a tiny converted model is
+enough to check the pipeline:
+
+    ct2-transformers-converter --model Helsinki-NLP/opus-mt-en-vi --output_dir weights/tiny-en-vi
+    python benchmark.py --model en-vi=weights/tiny-en-vi --device cpu --compute-types int8 \\
+        --batch-sizes 1,8 --beam-sizes 1,2 --output bench.json
+
+Without --model, the pairs come from the model manifest (--pairs en-vi,vi-en).
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+
+import ctranslate2
+
+from batcher import count_tokens
+from inference_config import CALIBRATION_SENTENCES, get_inference_config
+from model_manifest import load_manifest
+from translator_registry import load_translator
+
+# Whitespace token ranges of the input length buckets
+LENGTH_BUCKETS = {
+    "short": (1, 12),
+    "medium": (13, 40),
+    "long": (41, 200),
+}
+
+
+def load_corpus(corpus_path=None):
+    """
+    Read the benchmark sentences, one per line.
+
+    Args:
+        corpus_path (str): Text file or glob; defaults to merged_sentences_*.txt.
+
+    Returns:
+        list: Non-empty sentences.
+    """
+    paths = sorted(glob.glob(corpus_path or "merged_sentences_*.txt"))
+    sentences = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            sentences.extend(line.strip() for line in f if line.strip())
+    if not sentences:
+        print("No corpus found, using the built-in calibration sentences")
+        sentences = list(CALIBRATION_SENTENCES)
+    return sentences
+
+
+def sample_buckets(sentences, samples, seed=0):
+    """
+    Group sentences into length buckets and draw a fixed sample from each.
+
+    Args:
+        sentences (list): Corpus sentences.
+        samples (int): Sentences per bucket.
+        seed (int): Random seed, so runs use the same inputs.
+
+    Returns:
+        dict: Bucket name -> list of sentences (empty buckets are left out).
+    """
+    rng = random.Random(seed)
+    buckets = {}
+    for name, (low, high) in LENGTH_BUCKETS.items():
+        matching = [s for s in sentences if low <= count_tokens(s) <= high]
+        if not matching:
+            continue
+        if len(matching) >= samples:
+            buckets[name] = rng.sample(matching, samples)
+        else:
+            buckets[name] = [rng.choice(matching) for _ in range(samples)]
+    return buckets
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB elsewhere
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(translator, sentences, batch_size, beam_size):
+    """
+    Translate the sentences in batches and time every batch.
+
+    Returns:
+        dict: Throughput and latency figures for the case.
+    """
+    batches = [sentences[i : i + batch_size] for i in range(0, len(sentences), batch_size)]
+    source_tokens = sum(len(translator.tokenizer.tokenize(s)) for s in sentences)
+
+    # Warm up so the first batch does not include lazy initialization
+    translator.generate(text=batches[0], beam_size=beam_size, max_batch_size=batch_size)
+
+    latencies = []
+    start_time = time.perf_counter()
+    for batch in batches:
+        batch_start = time.perf_counter()
+        translator.generate(text=batch, beam_size=beam_size, max_batch_size=batch_size)
+        latencies.append(time.perf_counter() - batch_start)
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        "sentences": len(sentences),
+        "source_tokens": source_tokens,
+        "seconds": elapsed,
+        "sentences_per_second": len(sentences) / elapsed,
+        "tokens_per_second": source_tokens / elapsed,
+        "latency_p50_ms": percentile(latencies, 50) * 1000,
+        "latency_p95_ms": percentile(latencies, 95) * 1000,
+        "latency_p99_ms": percentile(latencies, 99) * 1000,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_benchmark(models, buckets, batch_sizes, beam_sizes, compute_types, device=None):
+    """
+    Run every combination of model, compute type, length bucket, batch size and beam size.
+
+    Args:
+        models (dict): Pair -> local model directory.
+        buckets (dict): Length bucket -> sentences, from sample_buckets.
+        batch_sizes (list): Batch sizes to try.
+        beam_sizes (list): Beam sizes to try.
+        compute_types (list): Compute types to try; None uses the configured one.
+        device (str): Device override; None uses the configured one.
+
+    Returns:
+        list: One result dict per case.
+    """
+    results = []
+    for pair, model_dir in models.items():
+        for compute_type in compute_types:
+            config = get_inference_config(pair)
+            if device:
+                config["device"] = device
+            if compute_type:
+                config["compute_type"] = compute_type
+
+            load_start = time.perf_counter()
+            try:
+                translator = load_translator(model_dir, config)
+            except (ValueError, RuntimeError) as e:
+                # Compute type not supported on this machine
+                print(f"Skipping {pair} {config['compute_type']}: {e}")
+                continue
+            load_time = time.perf_counter() - load_start
+
+            for bucket, sentences in buckets.items():
+                for batch_size in batch_sizes:
+                    for beam_size in beam_sizes:
+                        case = {
+                            "pair": pair,
+                            "device": config["device"],
+                            "compute_type": config["compute_type"],
+                            "intra_threads": config["intra_threads"],
+                            "inter_threads": config["inter_threads"],
+                            "length": bucket,
+                            "batch_size": batch_size,
+                            "beam_size": beam_size,
+                            "load_seconds": load_time,
+                        }
+                        case.update(run_case(translator, sentences, batch_size, beam_size))
+                        print(
+                            f"{pair} {case['compute_type']} {bucket} batch={batch_size} beam={beam_size}: "
+                            f"{case['sentences_per_second']:.1f} sentences/s, "
+                            f"p95 {case['latency_p95_ms']:.1f} ms"
+                        )
+                        results.append(case)
+            del translator
+    return results
+
+
+def parse_list(value, cast=str):
+    return [cast(item.strip()) for item in value.split(",") if item.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark translation throughput and latency.")
+    parser.add_argument("--model", action="append", default=[], help="pair=model_dir, may be repeated")
+    parser.add_argument("--pairs", default="en-vi", help="Manifest pairs to benchmark when --model is not given")
+    parser.add_argument("--corpus", help="Corpus file or glob (default merged_sentences_*.txt)")
+    parser.add_argument("--samples", type=int, default=64, help="Sentences per length bucket")
+    parser.add_argument("--batch-sizes", default="1,8,32")
+    parser.add_argument("--beam-sizes", default="1,2")
+    parser.add_argument("--compute-types", default="", help="Comma-separated; default is the configured one")
+    parser.add_argument("--device", help="Device override (cpu or cuda)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON report path (default: benchmark-<timestamp>.json)")
+    args = parser.parse_args()
+
+    if args.model:
+        models = dict(item.split("=", 1) for item in args.model)
+    else:
+        manifest = load_manifest()
+        models = {pair: manifest["models"][pair]["model_dir"] for pair in parse_list(args.pairs)}
+
+    buckets = sample_buckets(load_corpus(args.corpus), args.samples, args.seed)
+    results = run_benchmark(
+        models,
+        buckets,
+        parse_list(args.batch_sizes, int),
+        parse_list(args.beam_sizes, int),
+        parse_list(args.compute_types) or [None],
+        args.device,
+    )
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ctranslate2_version": ctranslate2.__version__,
+        "samples_per_bucket": args.samples,
+        "seed": args.seed,
+        "peak_rss_mb": peak_rss_mb(),
+        "results": results,
+    }
+    output = args.output or time.strftime("benchmark-%Y%m%d-%H%M%S.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark report with {len(results)} cases written to '{output}'")
@@ -1,14 +1,25 @@
 import os
 import random
+import hashlib
+import sqlite3
 import nltk
 from collections import defaultdict
 from tqdm import tqdm
 import shutil
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-# Ensure you have nltk data downloaded
-nltk.download("punkt")
-nltk.download("averaged_perceptron_tagger")
+# Ensure you have nltk data downloaded (only fetched when missing)
+nltk_resources = {
+    "punkt": "tokenizers/punkt",
+    "averaged_perceptron_tagger": "taggers/averaged_perceptron_tagger",
+}
+for package, resource in nltk_resources.items():
+    try:
+        nltk.data.find(resource)
+    except LookupError:
+        nltk.download(package)
 
 
 # Paths to the books directories
@@ -17,6 +28,15 @@ books_dir = "books"
 selected_books_dir = f"books_categorized_{books_number}"
 normalized_books_dir = f"books_categorized_{books_number}_normalized"
 
+# Processes used to normalize books and categorize titles (default: number of CPUs)
+normalize_workers = int(os.getenv("NORMALIZE_WORKERS", "0")) or None
+
+# Title -> category results are kept here so reruns only tag new books
+title_cache_path = os.getenv("TITLE_CATEGORY_CACHE", "title_categories.db")
+# Bump when the categorization rule changes, so cached categories are recomputed
+categorizer_version = "1"
+title_batch_size = 1000
+
 
 # Define a set of allowed characters (ASCII range for English text, including scientific characters)
 allowed_chars = set(
@@ -30,76 +50,143 @@ os.makedirs(selected_books_dir, exist_ok=True)
 os.makedirs(normalized_books_dir, exist_ok=True)
 
 
-# Function to categorize titles
-def categorize_titles(titles):
-    categories = defaultdict(list)
-    for title in tqdm(titles, desc="Categorizing Titles"):
-        tokens = nltk.word_tokenize(title)
-        tagged = nltk.pos_tag(tokens)
+# Function to categorize a batch of titles in one tagging call
+def categorize_title_batch(titles):
+    tagged_titles = nltk.pos_tag_sents([nltk.word_tokenize(title) for title in titles])
+    categories = []
+    for tagged in tagged_titles:
         # Simple categorization based on the most common noun or adjective
         category = "Other"
         for word, tag in tagged:
             if tag in ("NN", "JJ"):
                 category = word
                 break
-        categories[category].append(title)
+        categories.append(category)
     return categories
 
 
-# Function to clean and normalize the text
-def clean_text(text):
-    # Remove Project Gutenberg headers and footers
-    start_marker = "*** START OF THE PROJECT GUTENBERG EBOOK"
-    end_marker = "*** END OF THE PROJECT GUTENBERG EBOOK"
-    start_idx = text.find(start_marker)
-    end_idx = text.find(end_marker)
-
-    if start_idx != -1:
-        text = text[start_idx + len(start_marker) :]
-    if end_idx != -1:
-        text = text[:end_idx]
-
-    # Remove metadata (title, author, etc.)
-    text = re.sub(r"Title:.*\n", "", text)
-    text = re.sub(r"Author:.*\n", "", text)
-    text = re.sub(r"Illustrator:.*\n", "", text)
-    text = re.sub(r"Release date:.*\n", "", text)
-    text = re.sub(r"Language:.*\n", "", text)
-    text = re.sub(r"Original publication:.*\n", "", text)
-    text = re.sub(r"Credits:.*\n", "", text)
-
-    # Join lines that are part of the same sentence
-    text = re.sub(r"\n(?!\n)", " ", text)  # Replace single newlines with a space
-    text = re.sub(r"\s+", " ", text)  # Normalize whitespace
+def title_key(title):
+    return hashlib.sha1(f"{categorizer_version}\0{title}".encode("utf-8")).hexdigest()
 
-    # Remove non-standard characters
-    text = "".join(ch for ch in text if ch in allowed_chars)
 
-    # Split text into sentences
-    sentences = nltk.sent_tokenize(text)
+# Function to categorize titles, tagging only those missing from the on-disk cache
+def categorize_titles(titles, workers=normalize_workers):
+    connection = sqlite3.connect(title_cache_path)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS title_categories (key TEXT PRIMARY KEY, category TEXT NOT NULL)"
+    )
+    cached = dict(connection.execute("SELECT key, category FROM title_categories"))
+    keys = {title: title_key(title) for title in titles}
+    new_titles = [title for title in titles if keys[title] not in cached]
+    print(f"Categorizing {len(new_titles)} new titles ({len(titles) - len(new_titles)} cached)")
 
-    # Filter sentences based on length criteria and strip whitespace
-    filtered_sentences = [
-        sentence.strip() for sentence in sentences if 13 < len(sentence.strip()) < 512
+    batches = [
+        new_titles[i : i + title_batch_size] for i in range(0, len(new_titles), title_batch_size)
     ]
+    if batches:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(categorize_title_batch, batches)
+            for batch, batch_categories in tqdm(
+                zip(batches, results), total=len(batches), desc="Categorizing Titles"
+            ):
+                rows = [(keys[title], category) for title, category in zip(batch, batch_categories)]
+                connection.executemany(
+                    "INSERT OR REPLACE INTO title_categories (key, category) VALUES (?, ?)", rows
+                )
+                connection.commit()
+                cached.update(rows)
+    connection.close()
 
-    return filtered_sentences
+    categories = defaultdict(list)
+    for title in titles:
+        categories[cached[keys[title]]].append(title)
+    return categories
 
 
-# Function to process and save the text files
-def process_files(input_dir, output_dir):
-    files = [f for f in os.listdir(input_dir) if f.endswith(".txt")]
+# Precompiled normalization passes, built once per process
+gutenberg_start_marker = "*** START OF THE PROJECT GUTENBERG EBOOK"
+gutenberg_end_marker = "*** END OF THE PROJECT GUTENBERG EBOOK"
+metadata_pattern = re.compile(
+    r"(?:Title|Author|Illustrator|Release date|Language|Original publication|Credits):.*\n"
+)
+whitespace_pattern = re.compile(r"\s+")
+disallowed_chars_pattern = re.compile(
+    "[^" + "".join(re.escape(ch) for ch in sorted(allowed_chars)) + "]+"
+)
+
+
+# Function to clean and normalize the text, yielding sentences one by one
+def iter_clean_sentences(text):
+    # Keep only the body between the Project Gutenberg header and footer
+    start_idx = text.find(gutenberg_start_marker)
+    end_idx = text.find(gutenberg_end_marker)
+    start = start_idx + len(gutenberg_start_marker) if start_idx != -1 else 0
+    end = end_idx if end_idx != -1 and end_idx >= start else len(text)
+    text = text[start:end]
+
+    # Remove metadata (title, author, etc.) in one pass
+    text = metadata_pattern.sub("", text)
 
-    for file in tqdm(files, desc="Processing Files"):
-        with open(os.path.join(input_dir, file), "r", encoding="utf-8") as f:
-            text = f.read()
+    # Join lines of the same sentence and collapse every whitespace run to one space
+    text = whitespace_pattern.sub(" ", text)
 
-        sentences = clean_text(text)
+    # Remove non-standard characters
+    text = disallowed_chars_pattern.sub("", text)
+
+    # Split text into sentences, keeping those within the length criteria
+    for sentence in nltk.sent_tokenize(text):
+        sentence = sentence.strip()
+        if 13 < len(sentence) < 512:
+            yield sentence
+
+
+def clean_text(text):
+    return list(iter_clean_sentences(text))
+
+
+# Function to normalize one book, streaming its sentences to the output file
+def normalize_file(input_path, output_path):
+    with open(input_path, "r", encoding="utf-8") as f:
+        text = f.read()
 
-        # Save the cleaned text
-        with open(os.path.join(output_dir, f"{file}"), "w", encoding="utf-8") as f:
-            for sentence in sentences:
-                f.write(sentence + "\n")
+    sentence_count = 0
+    with open(output_path, "w", encoding="utf-8") as f:
+        for sentence in iter_clean_sentences(text):
+            f.write(sentence + "\n")
+            sentence_count += 1
+
+    return os.path.getsize(input_path), sentence_count
+
+
+# Function to process and save the text files across a process pool
+def process_files(input_dir, output_dir, workers=normalize_workers):
+    files = [f for f in os.listdir(input_dir) if f.endswith(".txt")]
+
+    start_time = time.perf_counter()
+    total_bytes = 0
+    total_sentences = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                normalize_file, os.path.join(input_dir, file), os.path.join(output_dir, file)
+            ): file
+            for file in files
+        }
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Processing Files"):
+            try:
+                file_bytes, sentence_count = future.result()
+            except Exception as e:
+                print(f"Error processing {futures[future]}: {e}")
+                continue
+            total_bytes += file_bytes
+            total_sentences += sentence_count
+
+    elapsed = time.perf_counter() - start_time
+    megabytes = total_bytes / 1024 / 1024
+    print(
+        f"Normalized {len(files)} files, {megabytes:.1f} MB in {elapsed:.1f} s "
+        f"({megabytes / elapsed if elapsed else 0:.1f} MB/s, {total_sentences} sentences)"
+    )
 
 
 # Function to select 200 books from the categorized titles
@@ -0,0 +1,193 @@
+"""
+Whole-book batching engine.
+
+All segments of a book are collected up front, sorted into buckets of similar source-token length
+and fed to one shared translator in dense batches, then reassembled in line order. This replaces
+thousands of single-chunk generate calls with a few dozen padded-as-little-as-possible ones.
+Segments that occur several times in a job (chapter headings, "* * *" separators, refrains, license
+paragraphs) are decoded once and the translation is reused for every occurrence.
+"""
+
+import sys
+from collections import OrderedDict
+
+from tqdm import tqdm
+
+import metrics
+from segmenter import iter_line_chunks, tokenizer_counter
+
+
+class SegmentDeduper:
+    """
+    Job-scoped memory of translated segments, so each distinct segment is decoded once per job.
+
+    Args:
+        max_mb (float): Memory used by remembered segments and their translations in MB, least
+            recently used first out; 0 for no limit.
+    """
+
+    def __init__(self, max_mb=0):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.segments = 0
+        self.decoded = 0
+        self._translations = OrderedDict()
+        self._bytes = 0
+
+    def translate(self, segments, translate_batch):
+        """
+        Translate segments, decoding only the ones not seen earlier in the job.
+
+        Args:
+            segments (list): Source segments.
+            translate_batch (callable): Function translating a list of distinct segments.
+
+        Returns:
+            list: Translation of each segment in input order.
+        """
+        known = {s: self._translations[s] for s in segments if s in self._translations}
+        new = list(dict.fromkeys(s for s in segments if s not in known))
+        if new:
+            known.update(zip(new, translate_batch(new)))
+        self.segments += len(segments)
+        self.decoded += len(new)
+        metrics.DEDUPLICATED_SEGMENTS.inc(len(segments) - len(new))
+
+        # Failed segments are not remembered, so a later occurrence retries them
+        for segment in dict.fromkeys(segments):
+            if known[segment] is None:
+                continue
+            if segment in self._translations:
+                self._translations.move_to_end(segment)
+                continue
+            self._translations[segment] = known[segment]
+            self._bytes += sys.getsizeof(segment) + sys.getsizeof(known[segment])
+        while self.max_bytes and self._bytes > self.max_bytes:
+            segment, translation = self._translations.popitem(last=False)
+            self._bytes -= sys.getsizeof(segment) + sys.getsizeof(translation)
+        return [known[s] for s in segments]
+
+    def saved(self):
+        """Number of decodes avoided so far."""
+        return self.segments - self.decoded
+
+    def summary(self):
+        """One-line report of segments, decodes and decodes saved."""
+        return (
+            f"{self.segments} segments, {self.decoded} decoded, {self.saved()} decodes saved "
+            f"({self.saved() / self.segments:.1%})"
+            if self.segments
+            else "no segments"
+        )
+
+
+def make_batches(token_counts, max_batch_size=32, batch_type="examples"):
+    """
+    Group segment indexes into length-bucketed batches.
+
+    Args:
+        token_counts (list): Source-token count of each segment.
+        max_batch_size (int): Maximum examples per batch, or maximum padded tokens per batch
+            when batch_type is "tokens".
+        batch_type (str): "examples" or "tokens".
+
+    Returns:
+        list: Batches, each a list of segment indexes sorted by length.
+    """
+    order = sorted(range(len(token_counts)), key=lambda i: token_counts[i])
+    batches = []
+    batch = []
+    for index in order:
+        if batch:
+            if batch_type == "tokens":
+                # Segments are sorted, so the current one is the longest in the padded batch
+                full = (len(batch) + 1) * token_counts[index] > max_batch_size
+            else:
+                full = len(batch) >= max_batch_size
+            if full:
+                batches.append(batch)
+                batch = []
+        batch.append(index)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def translate_segments(segments, translate_batch, token_counts, max_batch_size=32, batch_type="examples"):
+    """
+    Translate segments in length-bucketed batches.
+
+    Args:
+        segments (list): Source segments.
+        translate_batch (callable): Function translating a list of segments.
+        token_counts (list): Source-token count of each segment.
+        max_batch_size (int): See make_batches.
+        batch_type (str): See make_batches.
+
+    Returns:
+        list: Translation of each segment in input order (None where a batch failed).
+    """
+    translations = [None] * len(segments)
+    batches = make_batches(token_counts, max_batch_size, batch_type)
+    for batch in tqdm(batches, desc="Translating batches"):
+        try:
+            outputs = translate_batch([segments[i] for i in batch])
+        except Exception as e:
+            print(f"Error processing batch: {e}")
+            continue
+        for index, output in zip(batch, outputs):
+            translations[index] = output
+    return translations
+
+
+def translate_book(
+    lines,
+    translate_batch,
+    tokenizer,
+    max_tokens=512,
+    max_batch_size=32,
+    batch_type="examples",
+    deduper=None,
+):
+    """
+    Translate every line of a book with length-bucketed batching.
+
+    Args:
+        lines (list): Lines (paragraphs) of the book.
+        translate_batch (callable): Function translating a list of segments.
+        tokenizer: Tokenizer of the translating model.
+        max_tokens (int): Maximum source tokens per segment.
+        max_batch_size (int): See make_batches.
+        batch_type (str): See make_batches.
+        deduper (SegmentDeduper): Records the decodes saved; a new one is used when omitted.
+
+    Returns:
+        tuple: (translated lines, number of segments).
+    """
+    positions = []
+    segments = []
+    for line_index, chunk in iter_line_chunks(lines, tokenizer, max_tokens):
+        if chunk is not None:
+            positions.append(line_index)
+            segments.append(chunk)
+
+    # Decode each distinct segment once and fan the translation out to every occurrence
+    if deduper is None:
+        deduper = SegmentDeduper()
+
+    def translate_unique(unique_segments):
+        token_counts = tokenizer_counter(tokenizer)(unique_segments)
+        return translate_segments(
+            unique_segments, translate_batch, token_counts, max_batch_size, batch_type
+        )
+
+    translations = deduper.translate(segments, translate_unique)
+
+    line_chunks = [[] for _ in lines]
+    for line_index, translation in zip(positions, translations):
+        if translation:
+            line_chunks[line_index].append(translation)
+    translated_lines = [
+        " ".join(chunks) + "\n" if line.strip() else "\n"
+        for line, chunks in zip(lines, line_chunks)
+    ]
+    return translated_lines, len(segments)
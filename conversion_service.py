@@ -1,16 +1,23 @@
 import os
-import time
-import json
 import boto3
 import uuid
-from threading import Thread
+import itertools
+import tempfile
+from botocore.exceptions import ClientError
 from nltk.tokenize import sent_tokenize
-from hf_hub_ctranslate2 import MultiLingualTranslatorCT2fromHfHub, TranslatorCT2fromHfHub
-from transformers import AutoTokenizer
 from dotenv import load_dotenv
+from model_manifest import M2M_KEY, M2M_MODEL_NAME, get_model, load_manifest, startup
 from sendmail import send_secure_email  # Ensure this is your function for sending emails
-import re
-from concurrent.futures import ThreadPoolExecutor
+from translator_registry import get_translator
+from translation_cache import cache
+from pivot_pipeline import pivot_translate_texts
+from segmenter import iter_line_chunks
+from line_joiner import iter_joined_lines
+from book_engine import SegmentDeduper
+from job_journal import journal
+from sqs_consumer import RejectMessage, SQSConsumer, default_slots
+from decoding_tiers import resolve_tier, tier_model_id, tier_options
+import metrics
 
 # Load environment variables
 load_dotenv()
@@ -24,210 +31,256 @@ EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 sqs = boto3.client('sqs', region_name=AWS_REGION)
 s3 = boto3.client('s3', region_name=AWS_REGION)
 
-# Load the base model names from the configuration file
-def load_model_names(file_path):
-    model_names = {}
-    with open(file_path, "r") as f:
-        for line in f:
-            key, value = line.strip().split("=")
-            model_names[key] = value
-    return model_names
-
-weights_relative_path = os.getenv("MODEL_DIR")
-model_names = load_model_names("model_names.cfg")
+manifest = load_manifest()
 direct_model_mapping = {
-    k: f"{weights_relative_path}/ct2fast-{v}" for k, v in model_names.items()
+    pair: entry["model_dir"]
+    for pair, entry in manifest["models"].items()
+    if not entry["multilingual"]
 }
 supported_langs = ["en", "es", "fr", "de", "zh", "vi", "ko", "th", "ja"]
-model_name = "michaelfeil_ct2fast-m2m100_1.2B"
-model_dir = os.path.join(weights_relative_path, model_name)
-os.makedirs(model_dir, exist_ok=True)
-
-# Initialize the model and tokenizer
-tokenizer = AutoTokenizer.from_pretrained("facebook/m2m100_1.2B")
-model_m2m = MultiLingualTranslatorCT2fromHfHub(
-    model_name_or_path="michaelfeil/ct2fast-m2m100_1.2B",
-    device="cuda",
-    compute_type="int8_float16",
-    tokenizer=tokenizer,
-)
-tokenizer.save_pretrained(model_dir)
-if hasattr(model_m2m, "save_pretrained"):
-    model_m2m.save_pretrained(model_dir)
-else:
-    print("The model does not support the 'save_pretrained' method. Please implement a custom saving mechanism.")
-
-print(f"Model and tokenizer have been saved to '{model_dir}'")
-
-def split_text(text, max_length, tokenizer):
-    tokens = tokenizer.encode(text, add_special_tokens=False)
-    chunks = [tokens[i:i + max_length] for i in range(0, len(tokens), max_length)]
-    return [tokenizer.decode(chunk, skip_special_tokens=True) for chunk in chunks]
+PIVOT_BATCH_SIZE = int(os.getenv("PIVOT_BATCH_SIZE", "16"))
+# Chunks translated per window and size of each multipart upload part (S3 minimum is 5 MB)
+TRANSLATION_WINDOW_CHUNKS = int(os.getenv("TRANSLATION_WINDOW_CHUNKS", "64"))
+S3_PART_SIZE = int(os.getenv("S3_PART_SIZE_MB", "8")) * 1024 * 1024
+# Visibility timeout of in-flight messages; it is extended every third of this while a job runs
+SQS_VISIBILITY_TIMEOUT = int(os.getenv("SQS_VISIBILITY_TIMEOUT", "300"))
+SQS_WAIT_TIME_SECONDS = int(os.getenv("SQS_WAIT_TIME_SECONDS", "20"))
+# Memory a job may use to remember translated segments for reuse; each worker slot runs one job
+DEDUP_MAX_MB = float(os.getenv("DEDUP_MAX_MB", "16"))
+model_name = M2M_MODEL_NAME
+startup(manifest)
+
+
+def get_source_tokenizer(source_lang, target_lang):
+    # Chunks are sized with the tokenizer of the first model the text goes through
+    pair = f"{source_lang}-{target_lang}"
+    if pair in ["en-ko", "en-th", "en-ja"]:
+        return get_model(manifest, M2M_KEY).tokenizer
+    if pair in direct_model_mapping:
+        first_pair = pair
+    elif source_lang in supported_langs and target_lang in supported_langs:
+        first_pair = f"{source_lang}-en"
+    else:
+        return get_model(manifest, M2M_KEY).tokenizer
+    return get_translator(first_pair, direct_model_mapping[first_pair]).tokenizer
 
 # Translation functions
-def translate_text(sentences, src_lang, tgt_lang):
-    outputs = model_m2m.generate([sentences], src_lang=[src_lang], tgt_lang=[tgt_lang])
-    return outputs[0]
-
-def translate_with_timing(text, source_lang, target_lang):
-    def perform_translation(text, model_dir):
-        model = TranslatorCT2fromHfHub(
-            model_name_or_path=model_dir,
-            device="cuda",
-            compute_type="int8_float16",
-            tokenizer=AutoTokenizer.from_pretrained(model_dir),
-        )
-        translated_text = model.generate(text=text)
-        return translated_text
+def translate_batch_m2m(texts, src_lang, tgt_lang, tier=None):
+    # All chunks of a window are decoded by m2m100 in one generate call
+    tier = resolve_tier(tier)
+    def decode(misses):
+        return get_model(manifest, M2M_KEY).generate(misses, src_lang=[src_lang] * len(misses), tgt_lang=[tgt_lang] * len(misses), **tier_options(tier))
+    return cache.translate(tier_model_id(model_name, tier), f"{src_lang}-{tgt_lang}", texts, decode)
 
-    if f"{source_lang}-{target_lang}" in ["en-ko", "en-th", "en-ja"]:
-        translated_text = translate_text(text, source_lang, target_lang)
-        return translated_text
+def translate_batch(texts, pair, tier=None):
+    tier = resolve_tier(tier)
+    model_dir = direct_model_mapping[pair]
+    def decode(misses):
+        return get_translator(pair, model_dir).generate(text=misses, **tier_options(tier))
+    return cache.translate(tier_model_id(os.path.basename(model_dir), tier), pair, texts, decode)
 
-    if f"{source_lang}-{target_lang}" in direct_model_mapping:
-        translated_text = perform_translation(
-            text, direct_model_mapping[f"{source_lang}-{target_lang}"]
-        )
-    elif source_lang in supported_langs and target_lang in supported_langs:
-        intermediate_text = perform_translation(
-            text, direct_model_mapping[f"{source_lang}-en"]
-        )
-        final_text = perform_translation(
-            intermediate_text, direct_model_mapping[f"en-{target_lang}"]
+def translate_texts(texts, source_lang, target_lang, tier=None):
+    # Translate a list of chunks for one pair with one batched call per model
+    if not texts:
+        return []
+    tier = resolve_tier(tier)
+    pair = f"{source_lang}-{target_lang}"
+    if pair in ["en-ko", "en-th", "en-ja"]:
+        metrics.record_translation(pair, "m2m", tier)
+        return translate_batch_m2m(texts, source_lang, target_lang, tier)
+    if pair in direct_model_mapping:
+        metrics.record_translation(pair, "direct", tier)
+        return translate_batch(texts, pair, tier)
+    if source_lang in supported_langs and target_lang in supported_langs:
+        metrics.record_translation(pair, "pivot", tier)
+        translated_texts, timings = pivot_translate_texts(
+            texts,
+            lambda batch: translate_batch(batch, f"{source_lang}-en", tier),
+            lambda batch: translate_batch(batch, f"en-{target_lang}", tier),
+            batch_size=PIVOT_BATCH_SIZE,
         )
-        translated_text = final_text
-    else:
-        translated_text = translate_text(text, source_lang, target_lang)
-    return translated_text
+        return translated_texts
+    metrics.record_translation(pair, "m2m", tier)
+    return translate_batch_m2m(texts, source_lang, target_lang, tier)
 
-def remove_line(file_path):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        lines = file.readlines()
+def iter_translated_windows(lines, source_lang, target_lang, window_size=TRANSLATION_WINDOW_CHUNKS, skip_chunks=0, tier=None, deduper=None):
+    # Translate chunks window by window, yielding (chunks done so far, output lines of the window).
+    # The first skip_chunks chunks were translated by an earlier run and are not decoded again.
+    source_tokenizer = get_source_tokenizer(source_lang, target_lang)
+    chunks_done = skip_chunks
+    window = []
+    for _, chunk in itertools.islice(iter_line_chunks(lines, source_tokenizer, 512), skip_chunks, None):
+        window.append(chunk)
+        if len(window) >= window_size:
+            chunks_done += len(window)
+            yield chunks_done, translate_window(window, source_lang, target_lang, tier, deduper)
+            window = []
+    if window:
+        chunks_done += len(window)
+        yield chunks_done, translate_window(window, source_lang, target_lang, tier, deduper)
 
-    processed_lines = []
-    for i in range(len(lines)):
-        if lines[i].strip() == "":
-            processed_lines.append(lines[i])
-        else:
-            if i + 1 < len(lines) and lines[i + 1].strip() == "":
-                processed_lines.append(lines[i])
-            else:
-                processed_lines.append(lines[i].rstrip() + " ")
-
-    # Join the processed lines into a single string
-    processed_content = "".join(processed_lines)
-
-    # Write the processed content back to the file
-    with open(file_path, 'w', encoding='utf-8') as file:
-        file.write(processed_content)
-
-def process_file(s3_bucket, s3_key, source_lang, target_lang, unique_id, recipient_email):
-    # Download the file from S3
-    local_file_path = f"/tmp/{s3_key.split('/')[-1]}"
-    s3.download_file(s3_bucket, s3_key, local_file_path)
-
-    remove_line(local_file_path)
-
-    # Read the file content
-    with open(local_file_path, 'r', encoding='utf-8') as file:
-        lines = file.readlines()
-
-    # Split lines into chunks and store their original positions
-    line_chunks = []
-    line_positions = []
-    for i, line in enumerate(lines):
-        if not line.strip():
-            line_chunks.append(("\n", i))
+def translate_window(window, source_lang, target_lang, tier=None, deduper=None):
+    # Repeated segments are decoded once per job; the deduper fans translations out to every occurrence
+    chunks = [chunk for chunk in window if chunk is not None]
+    def translate_unique(unique_chunks):
+        return translate_texts(unique_chunks, source_lang, target_lang, tier)
+    if deduper is None:
+        deduper = SegmentDeduper()
+    translations = iter(deduper.translate(chunks, translate_unique))
+    return ["\n" if chunk is None else next(translations) + "\n" for chunk in window]
+
+class MultipartUploader:
+    # Upload a text stream to S3 part by part so the whole output never sits in memory.
+    # Bytes of the part being filled are buffered in a file under buffer_dir so that, together
+    # with state(), an interrupted upload can be resumed by a later worker.
+    def __init__(self, bucket, key, buffer_dir, part_size=S3_PART_SIZE, upload_id=None, parts=None, buffer_size=0):
+        self.bucket = bucket
+        self.key = key
+        self.buffer_dir = buffer_dir
+        self.part_size = part_size
+        self.parts = list(parts or [])
+        if upload_id is None:
+            upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
         else:
-            chunks = split_text(line, 512, tokenizer)
-            for chunk in chunks:
-                line_chunks.append((chunk, i))
-    
-    # Translate chunks and store results in the correct position
-    translated_lines = [""] * len(lines)
-
-    def translate_chunk(chunk, pos):
-        translated_chunk = translate_with_timing(chunk, source_lang, target_lang) + "\n"
-        return translated_chunk, pos
-
-    with ThreadPoolExecutor(max_workers=8) as executor:
-        future_to_position = {executor.submit(translate_chunk, chunk, pos): pos for chunk, pos in line_chunks}
-        for future in future_to_position:
-            translated_chunk, pos = future.result()
-            if translated_lines[pos] == "":
-                translated_lines[pos] = translated_chunk
-            else:
-                translated_lines[pos] += translated_chunk
-
-    # Combine translated lines into content
-    translated_content = "".join(translated_lines)
-
-    # Save the translated content to a new file
+            # Fails with NoSuchUpload if the upload was aborted or has expired
+            s3.list_parts(Bucket=bucket, Key=key, UploadId=upload_id, MaxParts=1)
+        self.upload_id = upload_id
+        self.buffer = open(self._part_path(len(self.parts) + 1), 'ab')
+        # Drop anything written after the last checkpoint
+        self.buffer.truncate(buffer_size)
+        self.buffer.seek(0, os.SEEK_END)
+
+    def _part_path(self, part_number):
+        return os.path.join(self.buffer_dir, f"part{part_number:05d}")
+
+    def write(self, text):
+        self.buffer.write(text.encode('utf-8'))
+        if self.buffer.tell() >= self.part_size:
+            self._upload_part()
+
+    def _upload_part(self):
+        part_number = len(self.parts) + 1
+        self.buffer.close()
+        with open(self._part_path(part_number), 'rb') as body:
+            response = s3.upload_part(Bucket=self.bucket, Key=self.key, PartNumber=part_number,
+                                      UploadId=self.upload_id, Body=body)
+        self.parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+        self.buffer = open(self._part_path(part_number + 1), 'wb')
+
+    def state(self):
+        # Make the buffered bytes durable before they are referenced by a checkpoint
+        self.buffer.flush()
+        os.fsync(self.buffer.fileno())
+        return {'upload_id': self.upload_id, 'parts': self.parts, 'buffer_size': self.buffer.tell()}
+
+    def checkpointed(self):
+        # Buffer files of parts recorded in a checkpoint are no longer needed
+        for part in self.parts:
+            path = self._part_path(part['PartNumber'])
+            if os.path.exists(path):
+                os.remove(path)
+
+    def complete(self):
+        if self.buffer.tell() or not self.parts:
+            self._upload_part()
+        self.buffer.close()
+        s3.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                     MultipartUpload={'Parts': self.parts})
+
+    def abort(self):
+        self.buffer.close()
+        s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+def open_uploader(s3_bucket, translated_file_name, unique_id):
+    # Resume the multipart upload recorded in the job journal, or start a new one
+    state = journal.load(unique_id)
+    if state:
+        try:
+            uploader = MultipartUploader(s3_bucket, translated_file_name, journal.buffer_dir(unique_id), **state['upload'])
+            print(f"Resuming job {unique_id} from chunk {state['chunks_done']}")
+            return uploader, state['chunks_done']
+        except ClientError as e:
+            print(f"Cannot resume job {unique_id}, starting over: {e}")
+            journal.remove(unique_id)
+    return MultipartUploader(s3_bucket, translated_file_name, journal.buffer_dir(unique_id)), 0
+
+def process_file(s3_bucket, s3_key, source_lang, target_lang, unique_id, recipient_email, tier=None):
+    # Download the file from S3 to a path of its own, so concurrent jobs on the same key
+    # never overwrite or delete each other's copy
+    fd, local_file_path = tempfile.mkstemp(prefix=f"{unique_id}_", suffix=f"_{s3_key.split('/')[-1]}")
+    os.close(fd)
+    try:
+        s3.download_file(s3_bucket, s3_key, local_file_path)
+    except Exception:
+        os.remove(local_file_path)
+        raise
+
+    # Stream paragraphs through translation and upload output parts as they fill up,
+    # so memory use does not grow with the size of the book. Progress is checkpointed after
+    # every window; on failure the upload is left open so a retry can resume it.
     translated_file_name = f"{s3_key.rsplit('.', 1)[0]}_{unique_id}_translated.txt"
-    translated_file_path = f"/tmp/{translated_file_name}"
-    with open(translated_file_path, 'w', encoding='utf-8') as file:
-        file.write(translated_content)
+    uploader, chunks_done = open_uploader(s3_bucket, translated_file_name, unique_id)
+    deduper = SegmentDeduper(max_mb=DEDUP_MAX_MB)
+    try:
+        with open(local_file_path, 'r', encoding='utf-8') as file:
+            for chunks_done, translated_lines in iter_translated_windows(
+                iter_joined_lines(file), source_lang, target_lang, skip_chunks=chunks_done, tier=tier,
+                deduper=deduper,
+            ):
+                for translated_line in translated_lines:
+                    uploader.write(translated_line)
+                journal.save(unique_id, {'chunks_done': chunks_done, 'upload': uploader.state()})
+                uploader.checkpointed()
+        uploader.complete()
+    finally:
+        os.remove(local_file_path)
+    journal.remove(unique_id)
+    print(f"Segment deduplication for {s3_key}: {deduper.summary()}")
 
-    # Upload the translated file back to S3
-    presigned_url = upload_file_to_s3(translated_file_path, s3_bucket, translated_file_name)
+    presigned_url = generate_presigned_url(s3_bucket, translated_file_name)
 
     # Send email notification with the download link
     email_subject = "Your book is ready!"
     email_body = f"Your processed book is ready. You can download it from: {presigned_url} within 7 days"
     send_secure_email(email_subject, email_body, recipient_email, EMAIL, EMAIL_PASSWORD)
     print(f"Email sent to {recipient_email}")
+    print(f"Translation cache stats: {cache.stats()}")
+
+def generate_presigned_url(bucket_name, object_name):
+    return s3.generate_presigned_url('get_object',
+                                     Params={'Bucket': bucket_name, 'Key': object_name},
+                                     ExpiresIn=3600*24*7) # URL expires in 7 days
 
-def upload_file_to_s3(file_name, bucket_name, object_name=None):
-    if object_name is None:
-        object_name = file_name
-    s3_client = boto3.client('s3')
+def handle_message(message_body):
+    s3_bucket = message_body['s3_bucket']
+    s3_key = message_body['s3_key']
+    source_lang = message_body['source_lang']
+    target_lang = message_body['target_lang']
+    unique_id = message_body['unique_id']
+    recipient_email = message_body['recipient_email']
+    # Optional speed/quality tier (fast, balanced or best); an unknown tier can never succeed,
+    # so the job is rejected once instead of being retried until the message expires
     try:
-        s3_client.upload_file(file_name, bucket_name, object_name)
-        # Generate a presigned URL for the uploaded file
-        presigned_url = s3_client.generate_presigned_url('get_object',
-                                                         Params={'Bucket': bucket_name,
-                                                                 'Key': object_name},
-                                                         ExpiresIn=3600*24*7) # URL expires in 7 days
-        return presigned_url
-    except Exception:
-        print("Credentials not available")
-        return None
+        tier = resolve_tier(message_body.get('tier'))
+    except ValueError as e:
+        try:
+            send_secure_email("Your book could not be translated",
+                              f"Your translation request for {s3_key.split('/')[-1]} was rejected: {e}",
+                              recipient_email, EMAIL, EMAIL_PASSWORD)
+        except Exception as email_error:
+            print(f"Failed to notify {recipient_email} of the rejected job: {email_error}")
+        raise RejectMessage(f"{s3_key}: {e}")
+    print("Reading queue. Found translation task " + s3_key)
+    process_file(s3_bucket, s3_key, source_lang, target_lang, unique_id, recipient_email, tier)
 
 def process_sqs_message():
-    while True:
-        try:
-            time.sleep(2)
-            message_body = read_message_from_sqs()
-            if message_body:
-                s3_bucket = message_body['s3_bucket']
-                s3_key = message_body['s3_key']
-                source_lang = message_body['source_lang']
-                target_lang = message_body['target_lang']
-                unique_id = message_body['unique_id']
-                recipient_email = message_body['recipient_email']
-                print("Reading queue. Found translation task " + s3_key)
-                process_file(s3_bucket, s3_key, source_lang, target_lang, unique_id, recipient_email)
-        except Exception as e:
-            print(f"An error occurred: {e}")
-
-# Function to read message from SQS
-def read_message_from_sqs():
-    response = sqs.receive_message(
-        QueueUrl=SQS_QUEUE_URL,
-        AttributeNames=['All'],
-        MaxNumberOfMessages=1,
-        MessageAttributeNames=['All'],
-        VisibilityTimeout=30,
-        WaitTimeSeconds=0
-    )
-
-    if 'Messages' in response:
-        for message in response['Messages']:
-            body = message['Body']
-            receipt_handle = message['ReceiptHandle']
-            sqs.delete_message(QueueUrl=SQS_QUEUE_URL, ReceiptHandle=receipt_handle)
-            return json.loads(body)
-    return None
+    # Long-poll the queue and run up to WORKER_SLOTS books at once; SIGTERM drains in-flight jobs
+    consumer = SQSConsumer(sqs, SQS_QUEUE_URL, handle_message, slots=default_slots(),
+                           wait_time=SQS_WAIT_TIME_SECONDS, visibility_timeout=SQS_VISIBILITY_TIMEOUT)
+    consumer.install_signal_handlers()
+    metrics.start_exporter()
+    consumer.run()
+    metrics.export_once()
 
 # Start the conversion service
 if __name__ == "__main__":
@@ -0,0 +1,72 @@
+"""
+Named speed/quality tiers for decoding.
+
+Callers pick a tier instead of raw decoding options; each tier maps to CTranslate2 translate_batch
+options, clamped by server-side caps so a request cannot ask for an arbitrarily expensive decode:
+
+    fast       Greedy search with a short maximum output, for previews and autocompletion.
+    balanced   CTranslate2's defaults (beam 2); what every path used before tiers existed.
+    best       Wider beam for the highest quality.
+
+    DEFAULT_TIER          Tier used when a request does not name one (default balanced).
+    MAX_BEAM_SIZE         Upper bound on the beam size of any tier (default 8).
+    MAX_DECODING_LENGTH   Upper bound on the output length of any tier (default 512).
+
+Translations from different tiers are cached separately.
+"""
+
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TIERS = {
+    "fast": {"beam_size": 1, "max_decoding_length": 128},
+    "balanced": {"beam_size": 2, "max_decoding_length": 256},
+    "best": {"beam_size": 5, "max_decoding_length": 512},
+}
+
+DEFAULT_TIER = os.getenv("DEFAULT_TIER", "balanced")
+MAX_BEAM_SIZE = int(os.getenv("MAX_BEAM_SIZE", "8"))
+MAX_DECODING_LENGTH = int(os.getenv("MAX_DECODING_LENGTH", "512"))
+
+
+def resolve_tier(tier=None):
+    """
+    Validate a requested tier name.
+
+    Args:
+        tier (str): Tier name, or None/empty for the default tier.
+
+    Returns:
+        str: The tier name.
+
+    Raises:
+        ValueError: If the tier is unknown.
+    """
+    tier = tier or DEFAULT_TIER
+    if tier not in TIERS:
+        raise ValueError(f"Unknown tier '{tier}' (expected one of: {', '.join(TIERS)})")
+    return tier
+
+
+def tier_options(tier=None):
+    """
+    Return the CTranslate2 decoding options of a tier, clamped to the server caps.
+
+    Args:
+        tier (str): Tier name, or None for the default tier.
+
+    Returns:
+        dict: Keyword arguments for generate / translate_batch.
+    """
+    options = dict(TIERS[resolve_tier(tier)])
+    options["beam_size"] = min(options["beam_size"], MAX_BEAM_SIZE)
+    options["max_decoding_length"] = min(options["max_decoding_length"], MAX_DECODING_LENGTH)
+    return options
+
+
+def tier_model_id(model_id, tier):
+    """Translation memory model id for a tier, so tiers never share cached translations."""
+    return f"{model_id}@{tier}"
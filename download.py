@@ -5,7 +5,10 @@ You can download all models or specific models based on language direction.
 * Download all models:
     huggingface-cli login 
     python download.py
-    
+
+Models are saved under MODEL_DIR; the services then load them from there without network calls
+(see model_manifest.py).
+
 Available translation directions are listed in the 'direct_model_mapping' dictionary.
 """
 
@@ -15,6 +18,7 @@ import subprocess
 import argparse
 from dotenv import load_dotenv
 
+from huggingface_hub import snapshot_download
 from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
 
 # Load environment variables from .env file
@@ -36,6 +40,12 @@ model_names = load_model_names("model_names.cfg")
 direct_model_mapping = {k: f"Eugenememe/{v}" for k, v in model_names.items()}
 
 
+def is_model_downloaded(model_dir):
+    """A converted model is complete once its weights exist; an empty model.bin is a failed download."""
+    model_file = os.path.join(model_dir, "model.bin")
+    return os.path.isfile(model_file) and os.path.getsize(model_file) > 0
+
+
 def download_and_save_model(model_name, model_dir):
     """Downloads a specific model into a directory specified by 'MODEL_DIR' and ensures no duplicates."""
     if not weights_relative_path:
@@ -90,7 +100,7 @@ def download_converted_models():
 
         output_dir = os.path.join(weights_relative_path, f"ct2fast-{model_name}")
 
-        if os.path.exists(output_dir):
+        if is_model_downloaded(output_dir):
             print(
                 f"Converted model already exists at: {output_dir}, skipping conversion."
             )
@@ -111,6 +121,29 @@ def download_converted_models():
             print(f"Deleted source folder: {source_dir}")
 
 
+def download_m2m_model():
+    """Downloads the multilingual m2m100 model used for en-ko, en-th and en-ja, skips if it already exists."""
+    if not weights_relative_path:
+        print(
+            "Environment variable 'MODEL_DIR' is not set. Please set 'MODEL_DIR' to the desired base directory for model storage."
+        )
+        return
+
+    model_dir = os.path.join(weights_relative_path, "michaelfeil_ct2fast-m2m100_1.2B")
+    if is_model_downloaded(model_dir):
+        print(f"Model already exists at: {model_dir}, skipping download.")
+        return
+
+    # The repository holds the already converted CTranslate2 model (model.bin, vocabulary, config)
+    print(f"Downloading 'michaelfeil/ct2fast-m2m100_1.2B' to '{model_dir}'...")
+    snapshot_download("michaelfeil/ct2fast-m2m100_1.2B", local_dir=model_dir, token=huggingface_token)
+    tokenizer = AutoTokenizer.from_pretrained("facebook/m2m100_1.2B")
+    tokenizer.save_pretrained(model_dir)
+    if not is_model_downloaded(model_dir):
+        raise RuntimeError(f"Download of the m2m100 model to '{model_dir}' is incomplete (no model.bin)")
+    print(f"Model and tokenizer have been saved to '{model_dir}'")
+
+
 def download_all_models():
     """Downloads all models specified in the direct_model_mapping."""
     for direction, model_name in direct_model_mapping.items():
@@ -128,4 +161,5 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     download_converted_models()
+    download_m2m_model()
     # download_all_models()
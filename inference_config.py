@@ -0,0 +1,215 @@
+"""
+Inference backend settings for CTranslate2 models.
+
+Device, compute type and CTranslate2's intra_threads/inter_threads come from environment variables,
+optionally overridden per model by suffixing the pair in upper case (e.g. CT2_COMPUTE_TYPE_EN_VI,
+or CT2_DEVICE_M2M for the m2m100 model):
+
+    CT2_DEVICE          "cuda", "cpu" or "auto" (default auto: cuda when a GPU is visible).
+    CT2_COMPUTE_TYPE    int8, int8_float16, int8_float32, float16, float32, ... (default int8_float16
+                        on cuda, int8 on cpu).
+    CT2_INTRA_THREADS   Threads used by one batch on CPU (default 0: CTranslate2 decides).
+    CT2_INTER_THREADS   Batches decoded in parallel (default 1).
+    CT2_CALIBRATE       1 to measure a few layouts the first time a model is loaded on this machine
+                        and use the fastest one (default 0).
+    CT2_CALIBRATION_FILE  Where calibration results are stored (default inference_calibration.json).
+
+Layouts found by calibration are used for models without explicit thread settings. Calibration can
+also be run ahead of time:
+
+    python inference_config.py en-vi weights/ct2fast-mix-en-vi-4m
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+
+import ctranslate2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CALIBRATION_FILE = os.getenv("CT2_CALIBRATION_FILE", "inference_calibration.json")
+
+# Fixed sentences used to time layouts during calibration
+CALIBRATION_SENTENCES = [
+    "The whole subject of the extinction of species has been involved in the most gratuitous mystery.",
+    "Some authors have even supposed that as the individual has a definite length of life, so have species a definite duration.",
+    "But how utterly groundless was my astonishment!",
+    "Professor Owen soon perceived that the tooth belonged to an extinct species.",
+    "If we ask ourselves why this or that species is rare, we answer that something is unfavourable in its conditions of life.",
+    "CHAPTER I.",
+    "She looked at him for a long time without saying a word.",
+    "The rain had stopped, and the streets were quiet again.",
+] * 8
+
+_calibration_lock = threading.Lock()
+
+
+def model_setting(name, model_key, default=None):
+    """Read a setting for a model, falling back to the global value and then the default."""
+    suffix = model_key.upper().replace("-", "_")
+    return os.getenv(f"{name}_{suffix}", os.getenv(name, default))
+
+
+def resolve_device(device):
+    """Map "auto" to "cuda" when a GPU is visible, else "cpu"."""
+    if device == "auto":
+        return "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+    return device
+
+
+def load_calibration():
+    try:
+        with open(CALIBRATION_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_calibration(model_key, layout):
+    with _calibration_lock:
+        calibration = load_calibration()
+        calibration[model_key] = layout
+        with open(CALIBRATION_FILE, "w", encoding="utf-8") as f:
+            json.dump(calibration, f, indent=2)
+
+
+def get_inference_config(model_key, model_dir=None):
+    """
+    Return the CTranslate2 settings for a model.
+
+    Args:
+        model_key (str): Language pair (e.g. "en-vi") or "m2m".
+        model_dir (str): Local model directory, needed only to calibrate on first use.
+
+    Returns:
+        dict: device, compute_type, intra_threads and inter_threads.
+    """
+    device = resolve_device(model_setting("CT2_DEVICE", model_key, "auto"))
+    default_compute_type = "int8_float16" if device == "cuda" else "int8"
+    config = {
+        "device": device,
+        "compute_type": model_setting("CT2_COMPUTE_TYPE", model_key, default_compute_type),
+        "intra_threads": int(model_setting("CT2_INTRA_THREADS", model_key, "0")),
+        "inter_threads": int(model_setting("CT2_INTER_THREADS", model_key, "1")),
+    }
+
+    # Explicit thread settings win over calibration
+    if model_setting("CT2_INTRA_THREADS", model_key) or model_setting("CT2_INTER_THREADS", model_key):
+        return config
+
+    layout_key = f"{model_key}/{device}"
+    layout = load_calibration().get(layout_key)
+    if layout is None and model_dir and device == "cpu" and model_setting("CT2_CALIBRATE", model_key, "0") == "1":
+        layout = calibrate(model_dir, device)
+        save_calibration(layout_key, layout)
+    if layout:
+        config["intra_threads"] = layout["intra_threads"]
+        config["inter_threads"] = layout["inter_threads"]
+        if not model_setting("CT2_COMPUTE_TYPE", model_key):
+            config["compute_type"] = layout["compute_type"]
+    return config
+
+
+def candidate_layouts(device):
+    """Return the (compute_type, intra_threads, inter_threads) layouts tried by calibration."""
+    if device == "cuda":
+        return [(compute_type, 1, 1) for compute_type in ("int8_float16", "float16")]
+    cores = os.cpu_count() or 1
+    thread_splits = [(cores, 1)]
+    for inter_threads in (2, 4):
+        if inter_threads <= cores:
+            thread_splits.append((cores // inter_threads, inter_threads))
+    return [
+        (compute_type, intra_threads, inter_threads)
+        for compute_type in ("int8", "int8_float32")
+        for intra_threads, inter_threads in thread_splits
+    ]
+
+
+def measure_layout(model_dir, device, compute_type, intra_threads, inter_threads, tokenizer):
+    """
+    Time the calibration sentences with one layout.
+
+    Returns:
+        float: Sentences per second.
+    """
+    translator = ctranslate2.Translator(
+        model_dir,
+        device=device,
+        compute_type=compute_type,
+        intra_threads=intra_threads,
+        inter_threads=inter_threads,
+    )
+    tokens = [
+        tokenizer.convert_ids_to_tokens(tokenizer.encode(sentence))
+        for sentence in CALIBRATION_SENTENCES
+    ]
+    # Warm up once, then time a full pass; sub-batches run in parallel on inter_threads workers
+    translator.translate_batch(tokens[:8], max_batch_size=8)
+    start_time = time.time()
+    translator.translate_batch(tokens, max_batch_size=8)
+    elapsed = time.time() - start_time
+    del translator
+    return len(tokens) / elapsed
+
+
+def calibrate(model_dir, device="cpu"):
+    """
+    Measure the candidate layouts for a model on this machine and return the fastest.
+
+    Args:
+        model_dir (str): Local model directory.
+        device (str): Device to calibrate.
+
+    Returns:
+        dict: compute_type, intra_threads, inter_threads and the measured sentences per second.
+    """
+    from tokenizer_registry import get_tokenizer
+
+    tokenizer = get_tokenizer(model_dir)
+    best = None
+    for compute_type, intra_threads, inter_threads in candidate_layouts(device):
+        try:
+            speed = measure_layout(
+                model_dir, device, compute_type, intra_threads, inter_threads, tokenizer
+            )
+        except (ValueError, RuntimeError) as e:
+            # Compute type not supported on this machine
+            print(f"Skipping layout {compute_type}/{intra_threads}x{inter_threads}: {e}")
+            continue
+        print(f"Layout {compute_type} intra={intra_threads} inter={inter_threads}: {speed:.1f} sentences/s")
+        if best is None or speed > best["sentences_per_second"]:
+            best = {
+                "compute_type": compute_type,
+                "intra_threads": intra_threads,
+                "inter_threads": inter_threads,
+                "sentences_per_second": speed,
+            }
+    print(f"Fastest layout for {model_dir}: {best}")
+    return best
+
+
+def ct2_kwargs(config):
+    """Return the keyword arguments for a CTranslate2 model from a config dict."""
+    return {
+        "device": config["device"],
+        "compute_type": config["compute_type"],
+        "intra_threads": config["intra_threads"],
+        "inter_threads": config["inter_threads"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pick the fastest CTranslate2 layout for a model.")
+    parser.add_argument("model_key", help="Language pair such as en-vi, or m2m")
+    parser.add_argument("model_dir", help="Local converted model directory")
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    layout = calibrate(args.model_dir, args.device)
+    if layout:
+        save_calibration(f"{args.model_key}/{args.device}", layout)
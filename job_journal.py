@@ -0,0 +1,83 @@
+"""
+Local journal of in-progress book translation jobs.
+
+After each translated window the SQS worker records how many chunks are done and the state of the
+S3 multipart upload. A restarted worker that receives the same job again resumes from the last
+checkpoint instead of retranslating the book. Each job also gets a directory for the output bytes
+that have not been uploaded as a part yet.
+
+    JOB_JOURNAL_DIR   Directory holding the journal (default /tmp/book_jobs).
+"""
+
+import json
+import os
+import shutil
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class JobJournal:
+    """
+    Checkpoint store with one JSON file and one buffer directory per job.
+
+    Args:
+        journal_dir (str): Directory holding the journal.
+    """
+
+    def __init__(self, journal_dir):
+        self.journal_dir = journal_dir
+        os.makedirs(journal_dir, exist_ok=True)
+
+    def _state_path(self, job_id):
+        return os.path.join(self.journal_dir, f"{job_id}.json")
+
+    def buffer_dir(self, job_id):
+        """Return (and create) the directory for a job's not-yet-uploaded output."""
+        path = os.path.join(self.journal_dir, job_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def load(self, job_id):
+        """
+        Load the last checkpoint of a job.
+
+        Args:
+            job_id (str): Job identifier.
+
+        Returns:
+            dict: The saved state, or None if the job has no checkpoint.
+        """
+        try:
+            with open(self._state_path(job_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, job_id, state):
+        """
+        Atomically replace the checkpoint of a job.
+
+        Args:
+            job_id (str): Job identifier.
+            state (dict): JSON-serializable job state.
+        """
+        path = self._state_path(job_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def remove(self, job_id):
+        """Delete the checkpoint and buffered output of a finished job."""
+        try:
+            os.remove(self._state_path(job_id))
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(os.path.join(self.journal_dir, job_id), ignore_errors=True)
+
+
+journal = JobJournal(os.getenv("JOB_JOURNAL_DIR", "/tmp/book_jobs"))
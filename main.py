@@ -1,11 +1,21 @@
 import os
+import json
+import threading
 import time
-from transformers import AutoTokenizer
-from flask import Flask, request, jsonify
+from concurrent.futures import Future
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from hf_hub_ctranslate2 import MultiLingualTranslatorCT2fromHfHub
 from dotenv import load_dotenv
-from hf_hub_ctranslate2 import TranslatorCT2fromHfHub
+from model_manifest import M2M_KEY, M2M_MODEL_NAME, get_model, load_manifest, startup
+from translator_registry import get_translator, registry
+from tokenizer_registry import get_tokenizer, tokenizer_registry
+from batcher import BatchScheduler, count_tokens
+from translation_cache import cache
+from pivot_pipeline import pivot_translate_text, pivot_translate_texts
+from segmenter import split_sentences_with_separators
+from shard_router import ShardRouter
+from decoding_tiers import resolve_tier, tier_model_id, tier_options
+import metrics
 
 load_dotenv()
 
@@ -16,54 +26,121 @@ app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
 
-def load_model_names(file_path):
-    model_names = {}
-    with open(file_path, "r") as f:
-        for line in f:
-            key, value = line.strip().split("=")
-            model_names[key] = value
-    return model_names
+# Models are read from the local manifest; only the eager ones are loaded at startup
+manifest = load_manifest()
+direct_model_mapping = {
+    k: v["model_dir"] for k, v in manifest["models"].items() if not v["multilingual"]
+}
 
+# Per-request limits for /translate/batch
+BATCH_REQUEST_MAX_ITEMS = int(os.getenv("BATCH_REQUEST_MAX_ITEMS", "256"))
+BATCH_REQUEST_MAX_TOKENS = int(os.getenv("BATCH_REQUEST_MAX_TOKENS", "16384"))
 
-# Load the base model names from the configuration file
-model_names = load_model_names("model_names.cfg")
+# Number of sentences per batch flowing through the two pivot stages
+PIVOT_BATCH_SIZE = int(os.getenv("PIVOT_BATCH_SIZE", "16"))
 
-# Dynamically construct the full model mapping,
-direct_model_mapping = {
-    k: f"{weights_relative_path}/ct2fast-{v}" for k, v in model_names.items()
-}
+# Number of sentences translated per streamed batch (?stream=1)
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "8"))
 
 # Supported languages for intermediate translation
 supported_langs = ["en", "es", "fr", "de", "zh", "vi", "ko", "th", "ja"]
 
-model_name = "michaelfeil_ct2fast-m2m100_1.2B"
-model_dir = os.path.join(weights_relative_path, model_name)
-os.makedirs(model_dir, exist_ok=True)
+# Languages listed by /supported_langs
+SUPPORTED_LANGUAGES = [
+    {"name": "German", "code": "de"},
+    {"name": "English", "code": "en"},
+    {"name": "Spanish", "code": "es"},
+    {"name": "French", "code": "fr"},
+    {"name": "Japanese", "code": "ja"},
+    {"name": "Korean", "code": "ko"},
+    {"name": "Thai", "code": "th"},
+    {"name": "Vietnamese", "code": "vi"},
+    {"name": "Chinese", "code": "zh"},
+]
 
-# Initialize the model and tokenizer
-tokenizer = AutoTokenizer.from_pretrained("facebook/m2m100_1.2B")
-model_m2m = MultiLingualTranslatorCT2fromHfHub(
-    model_name_or_path="michaelfeil/ct2fast-m2m100_1.2B",
-    device="cuda",
-    compute_type="int8_float16",
-    tokenizer=tokenizer,
-)
+model_name = M2M_MODEL_NAME
 
-tokenizer.save_pretrained(model_dir)
+# With SHARD_LAYOUT set, this process only routes requests and the shard workers hold the models
+SHARD_LAYOUT = os.getenv("SHARD_LAYOUT", "")
+IS_SHARD_WORKER = "SHARD_WORKER_ID" in os.environ
+IS_ROUTER = bool(SHARD_LAYOUT) and not IS_SHARD_WORKER
+_router = None
+_router_lock = threading.Lock()
 
-if hasattr(model_m2m, "save_pretrained"):
-    model_m2m.save_pretrained(model_dir)
-else:
-    print(
-        "The model does not support the 'save_pretrained' method. Please implement a custom saving mechanism."
+# Load and warm up the eager models before serving; shard workers load their own pairs instead
+startup_timings = {} if IS_ROUTER or IS_SHARD_WORKER else startup(manifest)
+
+
+def get_router():
+    """Start the shard workers on first use, so reloader and helper processes never start them."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ShardRouter(
+                SHARD_LAYOUT,
+                threads=int(os.getenv("SHARD_WORKER_THREADS", "4")),
+                timeout=float(os.getenv("SHARD_TIMEOUT", "600")),
+            )
+    return _router
+
+
+def stop_router():
+    """Stop the shard workers, if they were started."""
+    with _router_lock:
+        if _router is not None:
+            _router.stop()
+
+
+def metrics_text():
+    """Return this process's metrics; the router asks each shard worker for them on a scrape."""
+    return metrics.local_text()
+
+
+def collect_shard_metrics():
+    return get_router().broadcast(
+        "metrics_text", timeout=float(os.getenv("SHARD_METRICS_TIMEOUT", "5"))
+    )
+
+
+# Stage, batch and route metrics are recorded in the shard workers; /metrics gathers them
+if IS_ROUTER:
+    metrics.aggregate_shards(collect_shard_metrics)
+
+# Concurrent /translate requests for the same pair are decoded together
+scheduler = BatchScheduler()
+
+
+def decode_m2m(texts, src_lang, tgt_lang, tier):
+    return get_model(manifest, M2M_KEY).generate(
+        texts,
+        src_lang=[src_lang] * len(texts),
+        tgt_lang=[tgt_lang] * len(texts),
+        **tier_options(tier),
     )
 
-print(f"Model and tokenizer have been saved to '{model_dir}'")
+
+def decode_direct(texts, pair, tier):
+    model = get_translator(pair, direct_model_mapping[pair])
+    return model.generate(text=texts, **tier_options(tier))
+
+
+def direct_model_id(pair, tier):
+    return tier_model_id(os.path.basename(direct_model_mapping[pair]), tier)
+
+
+def translate_batch_m2m(texts, src_lang, tgt_lang, tier):
+    return cache.translate(
+        tier_model_id(model_name, tier),
+        f"{src_lang}-{tgt_lang}",
+        texts,
+        lambda misses: decode_m2m(misses, src_lang, tgt_lang, tier),
+    )
 
 
-def translate_text(sentences, src_lang, tgt_lang):
-    outputs = model_m2m.generate([sentences], src_lang=[src_lang], tgt_lang=[tgt_lang])
-    return outputs[0]
+def translate_batch_direct(texts, pair, tier):
+    return cache.translate(
+        direct_model_id(pair, tier), pair, texts, lambda misses: decode_direct(misses, pair, tier)
+    )
 
 
 def remove_prompt_from_translation(translated_text):
@@ -74,50 +151,227 @@ def remove_prompt_from_translation(translated_text):
         return translated_text
 
 
-def translate_with_timing(text, source_lang, target_lang):
-    def perform_translation(text, model_dir):
-        start_time = time.time()
-        model = TranslatorCT2fromHfHub(
-            model_name_or_path=model_dir,
-            device="cuda",
-            compute_type="int8_float16",
-            tokenizer=AutoTokenizer.from_pretrained(model_dir),
-        )
-        translated_text = model.generate(text=text)
-        end_time = time.time()
-        return translated_text, end_time - start_time
+def get_route(source_lang, target_lang):
+    """Return how a pair is translated: "direct", "pivot" (through English) or "m2m"."""
+    pair = f"{source_lang}-{target_lang}"
+    if pair in ["en-ko", "en-th", "en-ja"]:
+        return "m2m"
+    if pair in direct_model_mapping:
+        return "direct"
+    if source_lang in supported_langs and target_lang in supported_langs:
+        return "pivot"
+    return "m2m"
+
+
+def startup_shard(pairs):
+    """Load and warm up the models a shard worker's pairs are translated with."""
+    global startup_timings
+    keys = []
+    for pair in pairs:
+        source_lang, target_lang = pair.split("-")
+        route = get_route(source_lang, target_lang)
+        if route == "direct":
+            keys.append(pair)
+        elif route == "pivot":
+            keys.extend([f"{source_lang}-en", f"en-{target_lang}"])
+        else:
+            keys.append(M2M_KEY)
+    startup_timings = startup(manifest, keys=keys)
+
+
+def first_model_dir(source_lang, target_lang):
+    """Directory of the first model a pair's text goes through, whose tokenizer sizes the input."""
+    route = get_route(source_lang, target_lang)
+    if route == "direct":
+        return direct_model_mapping[f"{source_lang}-{target_lang}"]
+    if route == "pivot" and f"{source_lang}-en" in direct_model_mapping:
+        return direct_model_mapping[f"{source_lang}-en"]
+    return manifest["models"][M2M_KEY]["model_dir"]
+
+
+def count_text_tokens(texts, source_lang, target_lang):
+    """
+    Count source tokens with the tokenizer of the pair's first model.
+
+    The router process holds no models, so it uses the batcher's script-aware estimate instead.
+    Encodings are cached by the shared tokenizer, so decoding the texts later does not tokenize
+    them again.
+    """
+    if IS_ROUTER:
+        return [count_tokens(text) for text in texts]
+    return get_tokenizer(first_model_dir(source_lang, target_lang)).count_tokens(texts)
+
+
+def print_pivot_timings(source_lang, target_lang, timings):
+    print(
+        f"2-step translation time ({source_lang}-en-{target_lang}): {timings['total']:.4f} seconds "
+        f"(stage 1: {timings['first_stage']:.4f}s, stage 2: {timings['second_stage']:.4f}s, "
+        f"stage 2 idle: {timings['second_stage_wait']:.4f}s)"
+    )
 
-    if f"{source_lang}-{target_lang}" in ["en-ko", "en-th", "en-ja"]:
-        translated_text = translate_text(text, source_lang, target_lang)
-        return translated_text
 
-    if f"{source_lang}-{target_lang}" in direct_model_mapping:
-        translated_text, time_taken = perform_translation(
-            text, direct_model_mapping[f"{source_lang}-{target_lang}"]
+def translate_texts(texts, source_lang, target_lang, tier=None):
+    """Translate a list of texts for one pair in a single batched call per model."""
+    tier = resolve_tier(tier)
+    if IS_ROUTER:
+        return get_router().call(
+            f"{source_lang}-{target_lang}", "translate_texts", texts, source_lang, target_lang, tier
         )
-        print(
-            f"Direct translation time ({source_lang}-{target_lang}): {time_taken:.4f} seconds"
+    route = get_route(source_lang, target_lang)
+    metrics.record_translation(f"{source_lang}-{target_lang}", route, tier)
+    if route == "direct":
+        return translate_batch_direct(texts, f"{source_lang}-{target_lang}", tier)
+    if route == "pivot":
+        translated_texts, timings = pivot_translate_texts(
+            texts,
+            lambda batch: translate_batch_direct(batch, f"{source_lang}-en", tier),
+            lambda batch: translate_batch_direct(batch, f"en-{target_lang}", tier),
+            batch_size=PIVOT_BATCH_SIZE,
         )
-    elif source_lang in supported_langs and target_lang in supported_langs:
-        intermediate_text, time_taken_1 = perform_translation(
-            text, direct_model_mapping[f"{source_lang}-en"]
+        print_pivot_timings(source_lang, target_lang, timings)
+        return translated_texts
+    return translate_batch_m2m(texts, source_lang, target_lang, tier)
+
+
+def submit_translation(text, source_lang, target_lang, tier=None):
+    """
+    Start translating one text without waiting for the result.
+
+    Direct and m2m texts missing from the translation memory are queued on the pair's
+    micro-batcher, so the caller holds no thread while the batch forms and decodes. Pivot texts
+    run two batched stages and are not queued; the caller translates them with
+    translate_with_timing instead.
+
+    Returns:
+        Future: Resolves to the translated text, or None for pivot pairs.
+    """
+    tier = resolve_tier(tier)
+    pair = f"{source_lang}-{target_lang}"
+    if IS_ROUTER:
+        return get_router().submit(
+            pair, "translate_with_timing", text, source_lang, target_lang, tier
         )
-        final_text, time_taken_2 = perform_translation(
-            intermediate_text, direct_model_mapping[f"en-{target_lang}"]
+    route = get_route(source_lang, target_lang)
+    if route == "pivot":
+        return None
+    metrics.record_translation(pair, route, tier)
+    if route == "direct":
+        model_id = direct_model_id(pair, tier)
+        batcher_key = pair
+
+        def decode(texts):
+            return decode_direct(texts, pair, tier)
+
+    else:
+        model_id = tier_model_id(model_name, tier)
+        batcher_key = f"m2m:{pair}"
+
+        def decode(texts):
+            return decode_m2m(texts, source_lang, target_lang, tier)
+
+    cached = cache.get_many(model_id, pair, [text])[0]
+    if cached is not None:
+        future = Future()
+        future.set_result(cached)
+        return future
+
+    def store(done):
+        if done.exception() is None:
+            cache.put_many(model_id, pair, [text], [done.result()])
+
+    tokenizer = get_tokenizer(first_model_dir(source_lang, target_lang))
+    future = scheduler.submit(
+        batcher_key, text, decode, tier, lambda text: tokenizer.count_tokens([text])[0]
+    )
+    future.add_done_callback(store)
+    return future
+
+
+def translate_with_timing(text, source_lang, target_lang, tier=None):
+    tier = resolve_tier(tier)
+    if IS_ROUTER:
+        return get_router().call(
+            f"{source_lang}-{target_lang}",
+            "translate_with_timing",
+            text,
+            source_lang,
+            target_lang,
+            tier,
         )
-        translated_text = final_text
-        total_time_taken = time_taken_1 + time_taken_2
-        print(
-            f"2-step translation time ({source_lang}-en-{target_lang}): {total_time_taken:.4f} seconds"
+
+    if get_route(source_lang, target_lang) == "pivot":
+        metrics.record_translation(f"{source_lang}-{target_lang}", "pivot", tier)
+        translated_text, timings = pivot_translate_text(
+            text,
+            lambda batch: translate_batch_direct(batch, f"{source_lang}-en", tier),
+            lambda batch: translate_batch_direct(batch, f"en-{target_lang}", tier),
+            batch_size=PIVOT_BATCH_SIZE,
         )
-    else:
-        translated_text = translate_text(text, source_lang, target_lang)
+        print_pivot_timings(source_lang, target_lang, timings)
+        return translated_text
+
+    start_time = time.time()
+    translated_text = submit_translation(text, source_lang, target_lang, tier).result()
+    print(
+        f"Translation time ({source_lang}-{target_lang}): {time.time() - start_time:.4f} seconds"
+    )
     return translated_text
 
 
+def split_stream_batches(text, batch_size=STREAM_BATCH_SIZE):
+    """Split text into batches of (index, sentence, separator) for streaming translation."""
+    sentences, separators = split_sentences_with_separators(text)
+    segments = [
+        (sentence, separator)
+        for sentence, separator in zip(sentences, separators)
+        if sentence.strip()
+    ]
+    indexed = [(i, sentence, separator) for i, (sentence, separator) in enumerate(segments)]
+    return [indexed[i : i + batch_size] for i in range(0, len(indexed), batch_size)]
+
+
+def translate_stream_batch(batch, source_lang, target_lang, tier=None):
+    """Translate one streaming batch and return one event per sentence."""
+    outputs = translate_texts(
+        [sentence for _, sentence, _ in batch], source_lang, target_lang, tier
+    )
+    return [
+        {
+            "index": index,
+            "original_text": sentence,
+            "translated_text": output,
+            "separator": separator,
+        }
+        for (index, sentence, separator), output in zip(batch, outputs)
+    ]
+
+
+def format_stream_event(event, stream_format):
+    """Encode a streaming event as an NDJSON line or a server-sent event."""
+    if stream_format == "sse":
+        return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+
+def iter_translation_stream(text, source_lang, target_lang, stream_format="ndjson", tier=None):
+    """Yield encoded events for each sentence as soon as its batch is translated."""
+    count = 0
+    try:
+        for batch in split_stream_batches(text):
+            for event in translate_stream_batch(batch, source_lang, target_lang, tier):
+                count += 1
+                yield format_stream_event(event, stream_format)
+        yield format_stream_event({"done": True, "count": count}, stream_format)
+    except Exception as e:
+        yield format_stream_event({"error": str(e)}, stream_format)
+
+
+STREAM_MIMETYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+
 @app.route("/translate", methods=["GET", "POST"])
 def translate():
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     try:
         if request.method == "GET":
             original_text = request.args.get("text", "Please input some text")
@@ -127,13 +381,31 @@ def translate():
             original_text = data.get("text", "")
             source_lang = data.get("source_lang", "en")
             target_lang = data.get("target_lang", "vi")
+        try:
+            tier = resolve_tier(request.args.get("tier", data.get("tier")))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        if str(request.args.get("stream", data.get("stream", ""))).lower() in ("1", "true"):
+            stream_format = request.args.get("format", data.get("format", "ndjson"))
+            if stream_format not in STREAM_MIMETYPES:
+                return jsonify({"error": f"Unknown stream format '{stream_format}'"}), 400
+            return Response(
+                stream_with_context(
+                    iter_translation_stream(
+                        original_text, source_lang, target_lang, stream_format, tier
+                    )
+                ),
+                mimetype=STREAM_MIMETYPES[stream_format],
+            )
 
-        translated_text = translate_with_timing(original_text, source_lang, target_lang)
+        translated_text = translate_with_timing(original_text, source_lang, target_lang, tier)
         return jsonify(
             {
                 "original_text": original_text,
                 "source_lang": source_lang,
                 "target_lang": target_lang,
+                "tier": tier,
                 "translated_text": translated_text,
             }
         )
@@ -141,24 +413,119 @@ def translate():
         return jsonify({"error": str(e)}), 500
 
 
+def parse_batch_items(data):
+    """Normalize a /translate/batch body into {text, source_lang, target_lang, tier} items."""
+    source_lang = data.get("source_lang", "en")
+    target_lang = data.get("target_lang", "vi")
+    tier = data.get("tier")
+    items = [
+        {
+            "text": item.get("text", ""),
+            "source_lang": item.get("source_lang", source_lang),
+            "target_lang": item.get("target_lang", target_lang),
+            "tier": item.get("tier", tier),
+        }
+        if isinstance(item, dict)
+        else {"text": item, "source_lang": source_lang, "target_lang": target_lang, "tier": tier}
+        for item in data.get("items", data.get("texts", []))
+    ]
+    for item in items:
+        item["tier"] = resolve_tier(item["tier"])
+    return items
+
+
+def check_batch_limits(items):
+    """Return an error message if a batch request exceeds the per-request limits, else None."""
+    if len(items) > BATCH_REQUEST_MAX_ITEMS:
+        return f"Too many items (max {BATCH_REQUEST_MAX_ITEMS})"
+    # The cheap estimate rejects oversized requests before anything is tokenized
+    if sum(count_tokens(item["text"]) for item in items) > BATCH_REQUEST_MAX_TOKENS:
+        return f"Too many tokens (max {BATCH_REQUEST_MAX_TOKENS})"
+    texts_by_pair = {}
+    for item in items:
+        texts_by_pair.setdefault((item["source_lang"], item["target_lang"]), []).append(item["text"])
+    total_tokens = sum(
+        sum(count_text_tokens(texts, source_lang, target_lang))
+        for (source_lang, target_lang), texts in texts_by_pair.items()
+    )
+    if total_tokens > BATCH_REQUEST_MAX_TOKENS:
+        return f"Too many tokens (max {BATCH_REQUEST_MAX_TOKENS})"
+    return None
+
+
+def translate_batch_items(items):
+    """Translate batch items grouped by pair and tier and return the results in request order."""
+    # Group by pair and tier and sort each group by length so batches carry little padding
+    groups = {}
+    for index, item in enumerate(items):
+        key = (item["source_lang"], item["target_lang"], item["tier"])
+        groups.setdefault(key, []).append(index)
+
+    translated_texts = [None] * len(items)
+    for (group_source, group_target, group_tier), indexes in groups.items():
+        indexes.sort(key=lambda i: len(items[i]["text"]))
+        outputs = translate_texts(
+            [items[i]["text"] for i in indexes], group_source, group_target, group_tier
+        )
+        for i, output in zip(indexes, outputs):
+            translated_texts[i] = output
+
+    return [
+        {
+            "original_text": item["text"],
+            "source_lang": item["source_lang"],
+            "target_lang": item["target_lang"],
+            "tier": item["tier"],
+            "translated_text": translated_text,
+        }
+        for item, translated_text in zip(items, translated_texts)
+    ]
+
+
+@app.route("/translate/batch", methods=["POST"])
+def translate_batch():
+    data = request.get_json()
+    try:
+        try:
+            items = parse_batch_items(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        error = check_batch_limits(items)
+        if error:
+            return jsonify({"error": error}), 413
+        return jsonify({"results": translate_batch_items(items)})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/supported_langs", methods=["GET"])
 def fetch_supported_langs():
     try:
-        supported_languages = [
-            {"name": "German", "code": "de"},
-            {"name": "English", "code": "en"},
-            {"name": "Spanish", "code": "es"},
-            {"name": "French", "code": "fr"},
-            {"name": "Japanese", "code": "ja"},
-            {"name": "Korean", "code": "ko"},
-            {"name": "Thai", "code": "th"},
-            {"name": "Vietnamese", "code": "vi"},
-            {"name": "Chinese", "code": "zh"},
-        ]
-        return jsonify(supported_languages), 200
+        return jsonify(SUPPORTED_LANGUAGES), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def model_stats():
+    return {
+        **registry.stats(),
+        "translation_cache": cache.stats(),
+        "tokenizers": tokenizer_registry.stats(),
+        "startup": startup_timings,
+        "shards": get_router().stats() if IS_ROUTER else None,
+    }
+
+
+@app.route("/model_stats", methods=["GET"])
+def fetch_model_stats():
+    return jsonify(model_stats()), 200
+
+
+@app.route("/metrics", methods=["GET"])
+def fetch_metrics():
+    body, content_type = metrics.latest()
+    return Response(body, mimetype=content_type)
+
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -1,49 +1,196 @@
+import json
 import os
+import resource
+import struct
+import sys
+import tempfile
+import time
 from tqdm import tqdm
-from collections import Counter
+from fingerprints import FingerprintTable, TableFull, fingerprint
+from near_dup import NEAR_DUP_THRESHOLD, find_near_duplicates, format_stats
 
 # Path to the directory containing normalized books
 normalized_books_dir = "books_categorized_2000_normalized"
 output_file_prefix = "merged_sentences"
 
+# Sentences are deduplicated on 64- or 128-bit content fingerprints
+fingerprint_bits = int(os.getenv("MERGE_FINGERPRINT_BITS", "64"))
+# Memory budget of the in-memory fingerprint table; past it, dedup restarts on disk partitions
+max_table_mb = int(os.getenv("MERGE_MAX_TABLE_MB", "1024"))
+disk_partitions = int(os.getenv("MERGE_DISK_PARTITIONS", "64"))
 
-# Function to merge all unique sentences into multiple files with a maximum of 500,000 lines each
-def merge_sentences(input_dir, output_file_prefix, max_lines_per_file=100000):
-    files = [f for f in os.listdir(input_dir) if f.endswith(".txt")]
-    unique_sentences = set()
-    word_counter = Counter()
-    total_sentences = 0
-    current_line_count = 0
-    file_index = 1
+# Records read back from a partition file at a time
+partition_read_records = 1 << 16
+
+
+# Peak resident set size of this process in MB
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB elsewhere
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+# Writes kept sentences into files with a maximum number of lines each
+class SentenceWriter:
+    def __init__(self, output_file_prefix, max_lines_per_file):
+        self.output_file_prefix = output_file_prefix
+        self.max_lines_per_file = max_lines_per_file
+        self.total_sentences = 0
+        self.words = set()
+        self.current_line_count = 0
+        self.file_index = 1
+        self.outfile = open(self._output_file(), "w", encoding="utf-8")
+
+    def _output_file(self):
+        return f"{self.output_file_prefix}_{self.file_index}.txt"
+
+    def write(self, line):
+        self.outfile.write(line + "\n")
+        self.total_sentences += 1
+        self.current_line_count += 1
+        self.words.update(line.split())
+
+        if self.current_line_count >= self.max_lines_per_file:
+            self.outfile.close()
+            self.file_index += 1
+            self.outfile = open(self._output_file(), "w", encoding="utf-8")
+            self.current_line_count = 0
 
-    output_file = f"{output_file_prefix}_{file_index}.txt"
-    outfile = open(output_file, "w", encoding="utf-8")
+    def close(self):
+        self.outfile.close()
 
-    for file in tqdm(files, desc="Merging Sentences"):
+
+# Yield the stripped lines of every input file, in order
+def iter_sentences(input_dir, files, desc):
+    for file in tqdm(files, desc=desc):
         with open(os.path.join(input_dir, file), "r", encoding="utf-8") as infile:
             for line in infile:
-                line = line.strip()
-                if len(line) > 40:
-                    sentence_key = (line[:20], line[-20:])
-                else:
-                    sentence_key = (line[:20],) if len(line) >= 20 else (line[-20:],)
-                if sentence_key not in unique_sentences:
-                    unique_sentences.add(sentence_key)
-                    outfile.write(line + "\n")
-                    total_sentences += 1
-                    current_line_count += 1
-                    words = line.split()
-                    word_counter.update(words)
-
-                    if current_line_count >= max_lines_per_file:
-                        outfile.close()
-                        file_index += 1
-                        output_file = f"{output_file_prefix}_{file_index}.txt"
-                        outfile = open(output_file, "w", encoding="utf-8")
-                        current_line_count = 0
-
-    outfile.close()
-    return total_sentences, len(word_counter)
+                yield line.strip()
+
+
+# One pass: keep each sentence whose fingerprint was not seen yet
+def dedup_in_memory(input_dir, files, writer, bits, max_bytes):
+    table = FingerprintTable(bits, max_bytes=max_bytes)
+    sentences_read = 0
+    for line in iter_sentences(input_dir, files, "Merging Sentences"):
+        sentences_read += 1
+        if table.add(fingerprint(line, bits)):
+            writer.write(line)
+    return sentences_read
+
+
+# Three passes for corpora whose fingerprints do not fit in memory: spill (fingerprint, sentence
+# number) records to partitions, find the first occurrence of each fingerprint one partition at a
+# time, then re-read the input and write the sentences marked as first occurrences
+def dedup_on_disk(input_dir, files, writer, bits, partitions):
+    width = bits // 64
+    record = struct.Struct("<" + "Q" * (width + 1))
+
+    with tempfile.TemporaryDirectory(prefix="merge_sentences_") as tmp_dir:
+        partition_paths = [os.path.join(tmp_dir, f"{i}.bin") for i in range(partitions)]
+        partition_files = [open(path, "wb") for path in partition_paths]
+        sentences_read = 0
+        for line in iter_sentences(input_dir, files, "Fingerprinting Sentences"):
+            words = fingerprint(line, bits)
+            # High bits pick the partition; the table probes with the low bits
+            partition_files[(words[0] >> 32) % partitions].write(record.pack(*words, sentences_read))
+            sentences_read += 1
+        for partition_file in partition_files:
+            partition_file.close()
+
+        # Records of a partition are in sentence order, so the first add() of a fingerprint wins
+        keep = bytearray((sentences_read + 7) // 8)
+        for path in tqdm(partition_paths, desc="Deduplicating Partitions"):
+            table = FingerprintTable(bits)
+            with open(path, "rb") as partition_file:
+                while True:
+                    chunk = partition_file.read(record.size * partition_read_records)
+                    if not chunk:
+                        break
+                    for fields in record.iter_unpack(chunk):
+                        if table.add(fields[:width]):
+                            sentence_number = fields[width]
+                            keep[sentence_number >> 3] |= 1 << (sentence_number & 7)
+            os.remove(path)
+
+    for sentence_number, line in enumerate(iter_sentences(input_dir, files, "Writing Sentences")):
+        if keep[sentence_number >> 3] >> (sentence_number & 7) & 1:
+            writer.write(line)
+    return sentences_read
+
+
+# Optional near-duplicate stage: cluster the merged sentences with MinHash/LSH, rewrite the merged
+# files without the near-duplicates (same rollover) and save the cluster statistics
+def remove_near_duplicates(output_file_prefix, file_count, max_lines_per_file, threshold):
+    merged_files = [f"{output_file_prefix}_{file_index}.txt" for file_index in range(1, file_count + 1)]
+
+    def iter_merged(desc):
+        for path in tqdm(merged_files, desc=desc):
+            with open(path, "r", encoding="utf-8") as infile:
+                for line in infile:
+                    yield line.rstrip("\n")
+
+    drop, stats = find_near_duplicates(iter_merged("Hashing Sentences"), threshold=threshold)
+
+    examples = {cluster["sentence"]: cluster for cluster in stats["largest_clusters"]}
+    rewrite_prefix = f"{output_file_prefix}.near_dedup"
+    writer = SentenceWriter(rewrite_prefix, max_lines_per_file)
+    for sentence_number, line in enumerate(iter_merged("Removing Near-Duplicates")):
+        if sentence_number in examples:
+            examples[sentence_number]["text"] = line
+        if not drop[sentence_number >> 3] >> (sentence_number & 7) & 1:
+            writer.write(line)
+    writer.close()
+
+    for path in merged_files:
+        os.remove(path)
+    for file_index in range(1, writer.file_index + 1):
+        os.replace(f"{rewrite_prefix}_{file_index}.txt", f"{output_file_prefix}_{file_index}.txt")
+
+    with open(f"{output_file_prefix}_near_dup_stats.json", "w", encoding="utf-8") as f:
+        json.dump(stats, f, indent=2, ensure_ascii=False)
+    print(format_stats(stats))
+    return writer.total_sentences, len(writer.words)
+
+
+# Function to merge all unique sentences into multiple files with a maximum of 500,000 lines each
+def merge_sentences(
+    input_dir,
+    output_file_prefix,
+    max_lines_per_file=100000,
+    bits=fingerprint_bits,
+    max_table_bytes=max_table_mb * 1024 * 1024,
+    partitions=disk_partitions,
+    near_dup_threshold=NEAR_DUP_THRESHOLD,
+):
+    files = [f for f in os.listdir(input_dir) if f.endswith(".txt")]
+    start_time = time.perf_counter()
+
+    writer = SentenceWriter(output_file_prefix, max_lines_per_file)
+    mode = "memory"
+    try:
+        sentences_read = dedup_in_memory(input_dir, files, writer, bits, max_table_bytes)
+    except TableFull as e:
+        # Start over on disk; the output files are rewritten from the first one
+        print(f"{e}; falling back to {partitions} on-disk partitions")
+        writer.close()
+        writer = SentenceWriter(output_file_prefix, max_lines_per_file)
+        mode = "disk"
+        sentences_read = dedup_on_disk(input_dir, files, writer, bits, partitions)
+    writer.close()
+
+    elapsed = time.perf_counter() - start_time
+    print(
+        f"Deduplicated {sentences_read} sentences in {elapsed:.1f} s "
+        f"({sentences_read / elapsed if elapsed else 0:.0f} sentences/s, {mode} mode, "
+        f"{bits}-bit fingerprints, peak RSS {peak_rss_mb():.0f} MB)"
+    )
+
+    if near_dup_threshold:
+        return remove_near_duplicates(
+            output_file_prefix, writer.file_index, max_lines_per_file, near_dup_threshold
+        )
+    return writer.total_sentences, len(writer.words)
 
 
 # Main function to run the merging process
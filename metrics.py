@@ -0,0 +1,249 @@
+"""
+Prometheus metrics for the translation stack.
+
+The API serves them on GET /metrics. The SQS worker and the batch book translator have no HTTP
+server, so they export them periodically with start_exporter():
+
+    METRICS_TEXTFILE          Path of a node_exporter textfile collector file to rewrite.
+    METRICS_PUSHGATEWAY       Pushgateway address (host:port) to push to.
+    METRICS_JOB               Job name used for the pushgateway (default translation_worker).
+    METRICS_EXPORT_INTERVAL   Seconds between exports (default 15).
+
+Stage timings (tokenize, generate, detokenize) are recorded for every translator loaded through
+the translator registry, labelled by model key (language pair or "m2m").
+
+With SHARD_LAYOUT set, translations run in forked shard workers whose metrics live in their own
+processes. The router collects each worker's metrics on every scrape (aggregate_shards) and serves
+them next to its own, with a "shard" label naming the worker ("router" for the router itself).
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    push_to_gateway,
+    write_to_textfile,
+)
+from prometheus_client.metrics_core import Metric
+from prometheus_client.parser import text_string_to_metric_families
+
+load_dotenv()
+
+# Seconds, from sub-millisecond cache-warm tokenization up to long pivot decodes
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+OCCUPANCY_BUCKETS = (0.1, 0.25, 0.5, 0.75, 0.9, 1.0)
+
+TOKENIZE_SECONDS = Histogram(
+    "translation_tokenize_seconds", "Time spent tokenizing a batch", ["model"], buckets=STAGE_BUCKETS
+)
+GENERATE_SECONDS = Histogram(
+    "translation_generate_seconds", "Time spent decoding a batch", ["model"], buckets=STAGE_BUCKETS
+)
+DETOKENIZE_SECONDS = Histogram(
+    "translation_detokenize_seconds", "Time spent detokenizing a batch", ["model"], buckets=STAGE_BUCKETS
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "translation_queue_wait_seconds",
+    "Time a request waits in the micro-batcher before its batch starts",
+    ["pair"],
+    buckets=STAGE_BUCKETS,
+)
+BATCH_SIZE = Histogram(
+    "translation_batch_size", "Texts per micro-batch", ["pair"], buckets=BATCH_SIZE_BUCKETS
+)
+BATCH_OCCUPANCY = Histogram(
+    "translation_batch_occupancy",
+    "Micro-batch size as a fraction of the maximum batch size",
+    ["pair"],
+    buckets=OCCUPANCY_BUCKETS,
+)
+TRANSLATIONS = Counter(
+    "translation_requests_total",
+    "Translation requests by pair, route and decoding tier",
+    ["pair", "route", "tier"],
+)
+DEDUPLICATED_SEGMENTS = Counter(
+    "translation_deduplicated_segments_total",
+    "Book segments reusing the translation of an earlier occurrence in the same job",
+)
+MODEL_LOADS = Counter("translation_model_loads_total", "Models loaded into memory", ["model"])
+MODEL_EVICTIONS = Counter("translation_model_evictions_total", "Models evicted from memory", ["model"])
+MODEL_LOAD_SECONDS = Histogram(
+    "translation_model_load_seconds", "Time spent loading a model", ["model"], buckets=STAGE_BUCKETS
+)
+RESIDENT_MODELS = Gauge("translation_resident_models", "Models currently held in memory")
+
+
+@contextmanager
+def timed(histogram):
+    """Observe the duration of the block in a (labelled) histogram."""
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start_time)
+
+
+def _timed_method(method, histogram):
+    def wrapper(*args, **kwargs):
+        with timed(histogram):
+            return method(*args, **kwargs)
+
+    return wrapper
+
+
+def instrument_translator(translator, model_key):
+    """
+    Record tokenize, generate and detokenize timings of a translator.
+
+    hf_hub_ctranslate2 translators run generate() as tokenize_encode, _forward and tokenize_decode;
+    those methods are wrapped on the instance, so every caller of generate() is measured.
+
+    Args:
+        translator: Translator returned by the registry loader.
+        model_key (str): Language pair or "m2m", used as the metric label.
+
+    Returns:
+        The same translator.
+    """
+    for name, histogram in (
+        ("tokenize_encode", TOKENIZE_SECONDS),
+        ("_forward", GENERATE_SECONDS),
+        ("tokenize_decode", DETOKENIZE_SECONDS),
+    ):
+        method = getattr(translator, name, None)
+        if method is not None:
+            setattr(translator, name, _timed_method(method, histogram.labels(model=model_key)))
+    return translator
+
+
+def record_translation(pair, route, tier="balanced"):
+    """Count one translation request on a route ("direct", "pivot" or "m2m") and tier."""
+    TRANSLATIONS.labels(pair=pair, route=route, tier=tier).inc()
+
+
+def record_batch(pair, size, max_size, queue_waits):
+    """Record the size, occupancy and per-request queue wait of one micro-batch."""
+    BATCH_SIZE.labels(pair=pair).observe(size)
+    BATCH_OCCUPANCY.labels(pair=pair).observe(size / max_size)
+    histogram = QUEUE_WAIT_SECONDS.labels(pair=pair)
+    for wait in queue_waits:
+        histogram.observe(wait)
+
+
+class ShardMetricsCollector:
+    """
+    Merge the metrics of this process and of the shard workers, labelled by shard.
+
+    Metric families with the same name are merged into one, so the exposition stays valid when
+    every process exports the same metrics.
+
+    Args:
+        fetch (callable): Returns {worker_id: metrics in the Prometheus text format} of the
+            workers that answered.
+    """
+
+    def __init__(self, fetch):
+        self.fetch = fetch
+
+    def collect(self):
+        families = {}
+
+        def merge(shard, source_families):
+            for family in source_families:
+                merged = families.get(family.name)
+                if merged is None:
+                    merged = families[family.name] = Metric(
+                        family.name, family.documentation, family.type, family.unit
+                    )
+                for sample in family.samples:
+                    merged.add_sample(
+                        sample.name,
+                        {**sample.labels, "shard": shard},
+                        sample.value,
+                        sample.timestamp,
+                        sample.exemplar,
+                    )
+
+        # The router's own metrics take the same text round trip, so families line up by name
+        merge("router", text_string_to_metric_families(local_text()))
+        try:
+            worker_metrics = self.fetch()
+        except Exception as e:
+            print(f"Failed to collect shard worker metrics: {e}")
+            worker_metrics = {}
+        for worker_id, text in sorted(worker_metrics.items()):
+            merge(str(worker_id), text_string_to_metric_families(text))
+        return list(families.values())
+
+
+# Registry served by latest() when shard worker metrics are aggregated
+_shard_registry = None
+
+
+def aggregate_shards(fetch):
+    """
+    Serve the shard workers' metrics from this process's /metrics.
+
+    Args:
+        fetch (callable): See ShardMetricsCollector.
+    """
+    global _shard_registry
+    registry = CollectorRegistry()
+    registry.register(ShardMetricsCollector(fetch))
+    _shard_registry = registry
+
+
+def latest():
+    """Return the current metrics in the Prometheus text format and its content type."""
+    return generate_latest(_shard_registry or REGISTRY), CONTENT_TYPE_LATEST
+
+
+def local_text():
+    """Return this process's own metrics in the Prometheus text format."""
+    return generate_latest(REGISTRY).decode("utf-8")
+
+
+def export_once():
+    """Write the textfile and/or push to the gateway, whichever is configured."""
+    textfile = os.getenv("METRICS_TEXTFILE")
+    gateway = os.getenv("METRICS_PUSHGATEWAY")
+    if textfile:
+        write_to_textfile(textfile, REGISTRY)
+    if gateway:
+        push_to_gateway(gateway, job=os.getenv("METRICS_JOB", "translation_worker"), registry=REGISTRY)
+
+
+def start_exporter():
+    """
+    Export metrics every METRICS_EXPORT_INTERVAL seconds on a daemon thread.
+
+    Returns:
+        threading.Thread: The exporter thread, or None when no exporter is configured.
+    """
+    if not (os.getenv("METRICS_TEXTFILE") or os.getenv("METRICS_PUSHGATEWAY")):
+        return None
+    interval = float(os.getenv("METRICS_EXPORT_INTERVAL", "15"))
+
+    def run():
+        while True:
+            try:
+                export_once()
+            except Exception as e:
+                print(f"Failed to export metrics: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, daemon=True, name="metrics-exporter")
+    thread.start()
+    return thread
@@ -0,0 +1,179 @@
+"""
+Local model manifest, lazy loading and warmup.
+
+The manifest lists every model the services can use (the pairs in model_names.cfg plus the
+multilingual m2m100 model) with its local directory and whether it is loaded eagerly at startup.
+Startup only loads the eager models, runs a short warmup decode on each and logs a time-to-ready
+breakdown; every other model is loaded on first use. Models are always read from local directories,
+so no network calls are made (download them first with download.py).
+
+Build the manifest with:
+
+    python model_manifest.py --eager en-vi,vi-en,m2m
+
+    MODEL_MANIFEST   Manifest file (default model_manifest.json). When it does not exist, the manifest
+                     is built from model_names.cfg with the models in EAGER_MODELS marked eager.
+    EAGER_MODELS     Comma-separated models to load at startup when there is no manifest file.
+"""
+
+import argparse
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Models are read from local directories only; this must run before huggingface_hub is imported,
+# so import this module before anything that imports transformers
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+from hf_hub_ctranslate2 import MultiLingualTranslatorCT2fromHfHub  # noqa: E402
+
+from inference_config import ct2_kwargs  # noqa: E402
+from tokenizer_registry import get_tokenizer  # noqa: E402
+from translator_registry import get_translator  # noqa: E402
+
+MANIFEST_FILE = os.getenv("MODEL_MANIFEST", "model_manifest.json")
+M2M_KEY = "m2m"
+M2M_MODEL_NAME = "michaelfeil_ct2fast-m2m100_1.2B"
+WARMUP_TEXT = "Hello world."
+
+
+def load_model_names(file_path):
+    model_names = {}
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                key, value = line.strip().split("=")
+                model_names[key] = value
+    return model_names
+
+
+def is_model_downloaded(model_dir):
+    """Whether a converted model's weights are on disk; an empty model.bin is a failed download."""
+    model_file = os.path.join(model_dir, "model.bin")
+    return os.path.isfile(model_file) and os.path.getsize(model_file) > 0
+
+
+def build_manifest(cfg_path="model_names.cfg", eager=()):
+    """
+    Build the manifest from model_names.cfg.
+
+    Args:
+        cfg_path (str): Path to the model names configuration.
+        eager (iterable): Model keys (pairs or "m2m") to load at startup.
+
+    Returns:
+        dict: Manifest with one entry per model key.
+    """
+    weights_relative_path = os.getenv("MODEL_DIR")
+    models = {
+        pair: {"model_dir": f"{weights_relative_path}/ct2fast-{name}", "multilingual": False}
+        for pair, name in load_model_names(cfg_path).items()
+    }
+    models[M2M_KEY] = {
+        "model_dir": os.path.join(weights_relative_path, M2M_MODEL_NAME),
+        "multilingual": True,
+    }
+    for key, entry in models.items():
+        entry["eager"] = key in eager
+        entry["available"] = is_model_downloaded(entry["model_dir"])
+    return {"models": models}
+
+
+def load_manifest():
+    """Read the manifest file, or build it from model_names.cfg if there is none."""
+    try:
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        eager = [key.strip() for key in os.getenv("EAGER_MODELS", "").split(",") if key.strip()]
+        return build_manifest(eager=eager)
+
+
+def load_multilingual_translator(model_dir, config):
+    """Load the multilingual m2m100 translator from its local directory."""
+    # The tokenizer's source/target language is switched per call, so its outputs are not cached
+    return MultiLingualTranslatorCT2fromHfHub(
+        model_name_or_path=model_dir,
+        tokenizer=get_tokenizer(model_dir).tokenizer,
+        **ct2_kwargs(config),
+    )
+
+
+def get_model(manifest, key):
+    """
+    Return the resident model for a manifest key, loading it on first use.
+
+    Args:
+        manifest (dict): Manifest from load_manifest.
+        key (str): Language pair or "m2m".
+
+    Returns:
+        The translator for the key.
+    """
+    entry = manifest["models"][key]
+    if entry["multilingual"]:
+        return get_translator(key, entry["model_dir"], loader=load_multilingual_translator)
+    return get_translator(key, entry["model_dir"])
+
+
+def warmup(key, model):
+    """Run one short decode so the first real request does not pay for lazy initialization."""
+    if key == M2M_KEY:
+        model.generate([WARMUP_TEXT], src_lang=["en"], tgt_lang=["vi"])
+    else:
+        model.generate(text=WARMUP_TEXT)
+
+
+def startup(manifest, keys=None):
+    """
+    Load and warm up the eager models and log a time-to-ready breakdown.
+
+    Args:
+        manifest (dict): Manifest from load_manifest.
+        keys (iterable): Models to load instead of the ones marked eager (used by shard workers).
+
+    Returns:
+        dict: Load and warmup seconds per eager model, plus the total.
+    """
+    start_time = time.time()
+    timings = {}
+    if keys is None:
+        keys = [key for key, entry in manifest["models"].items() if entry["eager"]]
+    eager = set(keys)
+    for key, entry in manifest["models"].items():
+        if key not in eager:
+            continue
+        if not is_model_downloaded(entry["model_dir"]):
+            print(f"Warning: eager model {key} is not downloaded ({entry['model_dir']}), skipping")
+            continue
+        load_start = time.time()
+        model = get_model(manifest, key)
+        warmup_start = time.time()
+        warmup(key, model)
+        timings[key] = {"load": warmup_start - load_start, "warmup": time.time() - warmup_start}
+
+    total = time.time() - start_time
+    for key, timing in timings.items():
+        print(f"Startup {key}: load {timing['load']:.2f}s, warmup {timing['warmup']:.2f}s")
+    lazy = [key for key in manifest["models"] if key not in eager]
+    print(f"Ready in {total:.2f} seconds ({len(timings)} eager models, {len(lazy)} loaded on first use)")
+    return {"models": timings, "total": total}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the local model manifest.")
+    parser.add_argument("--eager", default="", help="Comma-separated models to load at startup")
+    args = parser.parse_args()
+
+    manifest = build_manifest(eager=[key.strip() for key in args.eager.split(",") if key.strip()])
+    with open(MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    for key, entry in manifest["models"].items():
+        if not entry["available"]:
+            print(f"Warning: {key} is not downloaded ({entry['model_dir']})")
+    print(f"Manifest with {len(manifest['models'])} models written to '{MANIFEST_FILE}'")
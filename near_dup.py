@@ -0,0 +1,306 @@
+"""
+Near-duplicate sentence detection with MinHash and LSH banding.
+
+Exact dedup keeps sentences that differ only in punctuation, case or a word. This stage estimates
+the Jaccard similarity of every pair of sentences without comparing all pairs:
+
+1. Each sentence is lowercased, stripped of punctuation and cut into character shingles; its
+   MinHash signature (NEAR_DUP_NUM_PERM 32-bit minimums) is computed on a process pool.
+2. Signatures are split into bands; sentences sharing a band are candidates. Band keys are
+   streamed to NEAR_DUP_SHARDS temporary shard files by hash as signatures come in, and each
+   worker groups the shard file it is given.
+3. Each cluster is the earliest sentence, which is kept, and the later candidates whose estimated
+   similarity to that sentence reaches the threshold, which are dropped. Similarity is not
+   chained: a sentence close to a dropped one but not to the kept one stays.
+
+    NEAR_DUP_THRESHOLD      Jaccard similarity at which sentences are near-duplicates (0 disables
+                            the stage in merge_sentences.py; 0.8 is a good start).
+    NEAR_DUP_NUM_PERM       MinHash permutations (default 64).
+    NEAR_DUP_SHINGLE_SIZE   Characters per shingle (default 5).
+    NEAR_DUP_WORKERS        Processes (default: number of CPUs).
+    NEAR_DUP_SHARDS         Bucket shards (default: number of processes).
+
+Signatures take NEAR_DUP_NUM_PERM * 4 bytes per sentence in memory (256 bytes by default); band
+keys take 16 bytes per sentence and band on disk.
+"""
+
+import functools
+import hashlib
+import itertools
+import os
+import random
+import re
+import tempfile
+import zlib
+from array import array
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+# Sentences hashed per task
+CHUNK_SIZE = 5000
+# Band key records read back from a shard file at a time
+SHARD_READ_RECORDS = 1 << 16
+# Largest clusters listed in the statistics
+TOP_CLUSTERS = 10
+
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0"))
+NEAR_DUP_NUM_PERM = int(os.getenv("NEAR_DUP_NUM_PERM", "64"))
+NEAR_DUP_SHINGLE_SIZE = int(os.getenv("NEAR_DUP_SHINGLE_SIZE", "5"))
+NEAR_DUP_WORKERS = int(os.getenv("NEAR_DUP_WORKERS", "0")) or None
+NEAR_DUP_SHARDS = int(os.getenv("NEAR_DUP_SHARDS", "0")) or None
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def shingles(sentence, size=NEAR_DUP_SHINGLE_SIZE):
+    """
+    Character shingles of a sentence, ignoring case, punctuation and spacing.
+
+    Args:
+        sentence (str): Sentence.
+        size (int): Characters per shingle.
+
+    Returns:
+        set: Shingles (the whole normalized text when shorter than a shingle).
+    """
+    text = _NON_WORD.sub(" ", sentence.lower()).strip()
+    if len(text) <= size:
+        return {text}
+    return {text[i : i + size] for i in range(len(text) - size + 1)}
+
+
+@functools.lru_cache(maxsize=None)
+def permutations(num_perm, seed=1):
+    """Deterministic (a, b) coefficients of the universal hashes, identical in every process."""
+    rng = random.Random(seed)
+    return tuple((rng.randrange(1, MERSENNE_PRIME), rng.randrange(MERSENNE_PRIME)) for _ in range(num_perm))
+
+
+def minhash(shingle_set, num_perm=NEAR_DUP_NUM_PERM):
+    """
+    MinHash signature of a shingle set.
+
+    Args:
+        shingle_set (set): Shingles.
+        num_perm (int): Number of hash functions.
+
+    Returns:
+        array: num_perm unsigned 32-bit minimums.
+    """
+    # crc32 is stable across processes, unlike hash()
+    hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingle_set]
+    return array(
+        "I",
+        (min((a * h + b) % MERSENNE_PRIME for h in hashes) & MAX_HASH for a, b in permutations(num_perm)),
+    )
+
+
+def choose_bands(threshold, num_perm):
+    """
+    Pick the LSH banding for a threshold.
+
+    A pair with similarity s shares at least one of b bands of r rows with probability
+    1 - (1 - s^r)^b, whose steepest point is near (1 / b)^(1 / r). The banding whose point is the
+    closest at or below the threshold is used, so that true near-duplicates are rarely missed;
+    extra candidates are filtered by the similarity check.
+
+    Args:
+        threshold (float): Jaccard threshold.
+        num_perm (int): Signature length.
+
+    Returns:
+        tuple: (bands, rows).
+    """
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    below = [(b, r) for b, r in options if (1 / b) ** (1 / r) <= threshold]
+    if below:
+        return max(below, key=lambda option: (1 / option[0]) ** (1 / option[1]))
+    return min(options, key=lambda option: abs((1 / option[0]) ** (1 / option[1]) - threshold))
+
+
+def _signature_chunk(sentences, num_perm, rows, shingle_size):
+    signatures = array("I")
+    band_keys = array("Q")
+    for sentence in sentences:
+        signature = minhash(shingles(sentence, shingle_size), num_perm)
+        signatures.extend(signature)
+        for start in range(0, num_perm, rows):
+            digest = hashlib.blake2b(signature[start : start + rows].tobytes(), digest_size=8).digest()
+            band_keys.append(int.from_bytes(digest, "little"))
+    return signatures, band_keys
+
+
+def _spill_band_keys(band_keys, first_position, shard_files):
+    # Append a (band key, position) record per band key to the shard file picked by the key, where
+    # position = sentence number * bands + band
+    buffers = [array("Q") for _ in shard_files]
+    for position, key in enumerate(band_keys, first_position):
+        buffers[key % len(shard_files)].extend((key, position))
+    for shard_file, buffer in zip(shard_files, buffers):
+        buffer.tofile(shard_file)
+
+
+def _bucket_shard(path, bands):
+    # Group the records of one shard file by (band, key); buckets of one sentence are not candidates
+    buckets = defaultdict(list)
+    with open(path, "rb") as shard_file:
+        while True:
+            records = array("Q", shard_file.read(16 * SHARD_READ_RECORDS))
+            if not records:
+                break
+            for i in range(0, len(records), 2):
+                key, position = records[i], records[i + 1]
+                buckets[(position % bands, key)].append(position // bands)
+    return [members for members in buckets.values() if len(members) > 1]
+
+
+def _iter_chunks(sentences, lengths):
+    chunk = []
+    for sentence in sentences:
+        chunk.append(sentence)
+        lengths.append(len(sentence))
+        if len(chunk) >= CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def find_near_duplicates(
+    sentences,
+    threshold=NEAR_DUP_THRESHOLD,
+    num_perm=NEAR_DUP_NUM_PERM,
+    shingle_size=NEAR_DUP_SHINGLE_SIZE,
+    workers=NEAR_DUP_WORKERS,
+    shards=NEAR_DUP_SHARDS,
+):
+    """
+    Cluster near-duplicate sentences.
+
+    Args:
+        sentences (iterable): Sentences, streamed in corpus order.
+        threshold (float): Jaccard similarity at which two sentences are near-duplicates.
+        num_perm (int): MinHash permutations.
+        shingle_size (int): Characters per shingle.
+        workers (int): Processes (default: number of CPUs).
+        shards (int): Bucket shards (default: number of processes).
+
+    Returns:
+        tuple: (drop, stats) where drop is a bitmap (bytearray) of the sentence numbers to remove
+        and stats the cluster statistics; stats["largest_clusters"] lists the sentence number of
+        the kept sentence of each of the largest clusters.
+    """
+    if not 0 < threshold <= 1:
+        raise ValueError(f"Near-duplicate threshold must be in (0, 1], not {threshold}")
+    bands, rows = choose_bands(threshold, num_perm)
+    workers = workers or os.cpu_count() or 1
+    shards = shards or workers
+
+    signatures = array("I")
+    lengths = array("I")
+    with tempfile.TemporaryDirectory(prefix="near_dup_") as tmp_dir, ProcessPoolExecutor(
+        max_workers=workers
+    ) as executor:
+        shard_paths = [os.path.join(tmp_dir, f"{i}.bin") for i in range(shards)]
+        shard_files = [open(path, "wb") for path in shard_paths]
+        positions = 0
+
+        def collect(future):
+            nonlocal positions
+            chunk_signatures, chunk_keys = future.result()
+            signatures.extend(chunk_signatures)
+            _spill_band_keys(chunk_keys, positions, shard_files)
+            positions += len(chunk_keys)
+
+        # Bounded window of in-flight chunks, so the input is streamed rather than loaded at once
+        pending = []
+        for chunk in _iter_chunks(sentences, lengths):
+            pending.append(executor.submit(_signature_chunk, chunk, num_perm, rows, shingle_size))
+            if len(pending) >= workers * 2:
+                collect(pending.pop(0))
+        for future in pending:
+            collect(future)
+        for shard_file in shard_files:
+            shard_file.close()
+
+        sentence_count = len(lengths)
+        # Workers read their own shard file; only the multi-sentence buckets come back
+        groups = [
+            group
+            for shard in executor.map(_bucket_shard, shard_paths, itertools.repeat(bands))
+            for group in shard
+        ]
+
+    def similarity(left, right):
+        left_signature = signatures[left * num_perm : (left + 1) * num_perm]
+        right_signature = signatures[right * num_perm : (right + 1) * num_perm]
+        return sum(x == y for x, y in zip(left_signature, right_signature)) / num_perm
+
+    # Kept sentence of every dropped sentence. Buckets are visited by their earliest sentence, so
+    # when a bucket is reached that sentence is already final: kept, or dropped under a kept one
+    kept_by = {}
+    candidates = 0
+    for group in sorted(groups, key=min):
+        first = min(group)
+        kept = kept_by.get(first, first)
+        for other in group:
+            if other == first or other in kept_by:
+                continue
+            candidates += 1
+            # Compare with the sentence that stays, not with first, so similarity never chains
+            if similarity(kept, other) >= threshold:
+                kept_by[other] = kept
+
+    clusters = defaultdict(set)
+    for member, root in kept_by.items():
+        clusters[root].add(member)
+    drop = bytearray((sentence_count + 7) // 8)
+    removed_chars = 0
+    size_counts = Counter()
+    for root, members in clusters.items():
+        for member in members:
+            drop[member >> 3] |= 1 << (member & 7)
+            removed_chars += lengths[member]
+        members.add(root)
+        size_counts[len(members)] += 1
+
+    removed = sum(len(members) - 1 for members in clusters.values())
+    total_chars = sum(lengths)
+    largest = sorted(clusters.items(), key=lambda item: (-len(item[1]), item[0]))[:TOP_CLUSTERS]
+    stats = {
+        "threshold": threshold,
+        "num_perm": num_perm,
+        "bands": bands,
+        "rows": rows,
+        "sentences": sentence_count,
+        "candidate_pairs": candidates,
+        "clusters": len(clusters),
+        "clustered_sentences": sum(len(members) for members in clusters.values()),
+        "removed_sentences": removed,
+        "removed_sentence_ratio": removed / sentence_count if sentence_count else 0,
+        "removed_chars": removed_chars,
+        "removed_char_ratio": removed_chars / total_chars if total_chars else 0,
+        "largest_cluster": max(size_counts, default=0),
+        "cluster_sizes": {str(size): count for size, count in sorted(size_counts.items())},
+        "largest_clusters": [{"sentence": root, "size": len(members)} for root, members in largest],
+    }
+    return drop, stats
+
+
+def format_stats(stats):
+    """Human-readable summary of find_near_duplicates statistics."""
+    lines = [
+        f"Near-duplicates (Jaccard >= {stats['threshold']}, {stats['bands']} bands x {stats['rows']} rows): "
+        f"removed {stats['removed_sentences']} of {stats['sentences']} sentences "
+        f"({stats['removed_sentence_ratio']:.1%}), {stats['removed_chars']} characters "
+        f"({stats['removed_char_ratio']:.1%})",
+        f"{stats['clusters']} clusters covering {stats['clustered_sentences']} sentences, "
+        f"largest {stats['largest_cluster']}, {stats['candidate_pairs']} candidate pairs checked",
+    ]
+    for cluster in stats["largest_clusters"]:
+        text = cluster.get("text", f"sentence {cluster['sentence']}")
+        lines.append(f"  {cluster['size']:>6} x {text[:100]}")
+    return "\n".join(lines)
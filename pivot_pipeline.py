@@ -0,0 +1,125 @@
+"""
+Two-stage pipelined pivot translation (source -> English -> target).
+
+Instead of translating the whole text into English before the second model starts, the input is
+split into sentence batches. A background thread runs the first model batch by batch and hands each
+result to the second model through a bounded queue, so both models work at the same time. Timings
+are reported per stage so pivot latency can be attributed.
+"""
+
+import queue
+import threading
+import time
+
+from segmenter import split_sentences_with_separators
+
+_DONE = object()
+
+
+def run_pivot_pipeline(batches, first_stage, second_stage, max_queued=2):
+    """
+    Run batches through two translation stages concurrently.
+
+    Args:
+        batches (list): List of text batches (each a list of str).
+        first_stage (callable): Batched translate function source -> pivot.
+        second_stage (callable): Batched translate function pivot -> target.
+        max_queued (int): Maximum number of finished first-stage batches waiting for the second stage.
+
+    Returns:
+        tuple: (list of translated batches in input order, dict of stage timings in seconds).
+    """
+    handoff = queue.Queue(maxsize=max_queued)
+    stopped = threading.Event()
+    timings = {"first_stage": 0.0, "second_stage": 0.0, "second_stage_wait": 0.0}
+
+    def hand_off(item):
+        # Give up once the second stage has stopped reading, instead of blocking on a full queue
+        while not stopped.is_set():
+            try:
+                handoff.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for batch in batches:
+                if stopped.is_set():
+                    return
+                start_time = time.time()
+                intermediate = first_stage(batch)
+                timings["first_stage"] += time.time() - start_time
+                if not hand_off(intermediate):
+                    return
+        except Exception as e:
+            hand_off(e)
+            return
+        hand_off(_DONE)
+
+    start_time = time.time()
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    outputs = []
+    try:
+        while True:
+            wait_start = time.time()
+            item = handoff.get()
+            timings["second_stage_wait"] += time.time() - wait_start
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            stage_start = time.time()
+            outputs.append(second_stage(item))
+            timings["second_stage"] += time.time() - stage_start
+    finally:
+        # Also runs when the second stage raises: stop the producer and wait for it to exit
+        stopped.set()
+        producer.join()
+
+    timings["total"] = time.time() - start_time
+    return outputs, timings
+
+
+def pivot_translate_texts(texts, first_stage, second_stage, batch_size=16):
+    """
+    Translate a list of texts through the pivot pipeline.
+
+    Args:
+        texts (list): Texts to translate.
+        first_stage (callable): Batched translate function source -> pivot.
+        second_stage (callable): Batched translate function pivot -> target.
+        batch_size (int): Number of texts per pipeline batch.
+
+    Returns:
+        tuple: (translated texts in input order, stage timings).
+    """
+    batches = [texts[i : i + batch_size] for i in range(0, len(texts), batch_size)]
+    outputs, timings = run_pivot_pipeline(batches, first_stage, second_stage)
+    return [text for batch in outputs for text in batch], timings
+
+
+def pivot_translate_text(text, first_stage, second_stage, batch_size=16):
+    """
+    Translate one (possibly long) text sentence by sentence through the pivot pipeline.
+
+    Args:
+        text (str): Text to translate.
+        first_stage (callable): Batched translate function source -> pivot.
+        second_stage (callable): Batched translate function pivot -> target.
+        batch_size (int): Number of sentences per pipeline batch.
+
+    Returns:
+        tuple: (translated text, stage timings).
+    """
+    sentences, separators = split_sentences_with_separators(text)
+    indexes = [i for i, sentence in enumerate(sentences) if sentence.strip()]
+    translated, timings = pivot_translate_texts(
+        [sentences[i] for i in indexes], first_stage, second_stage, batch_size
+    )
+    for i, translated_sentence in zip(indexes, translated):
+        sentences[i] = translated_sentence
+    return "".join(s + sep for s, sep in zip(sentences, separators)), timings
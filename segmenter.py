@@ -0,0 +1,159 @@
+"""
+Sentence segmentation and token-aware packing of model inputs.
+
+Text is split into sentences and sentences are packed greedily into chunks whose source-token count,
+measured with the model's own tokenizer, stays within max_tokens. Sentences that are longer than
+max_tokens on their own are split on word boundaries (or, for text without spaces, on token
+boundaries). Chunks are produced by generators so the book pipelines can stream through them.
+"""
+
+import re
+
+# Sentence boundary followed by whitespace; the whitespace is captured so it can be restored
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?;"])(\s+)')
+
+
+def split_sentences_with_separators(text):
+    """
+    Split text into sentences, keeping the separators.
+
+    Args:
+        text (str): Input text.
+
+    Returns:
+        tuple: (sentences, separators) where separators[i] follows sentences[i].
+    """
+    parts = _SENTENCE_BOUNDARY.split(text)
+    return parts[0::2], parts[1::2] + [""]
+
+
+def split_sentences(text):
+    """
+    Split text into non-empty, stripped sentences.
+
+    Args:
+        text (str): Input text.
+
+    Returns:
+        list: Sentences.
+    """
+    sentences, _ = split_sentences_with_separators(text)
+    return [sentence.strip() for sentence in sentences if sentence.strip()]
+
+
+def tokenizer_counter(tokenizer):
+    """
+    Build a batched token counter from a Hugging Face tokenizer.
+
+    Args:
+        tokenizer: Tokenizer of the model that will translate the chunks. A SharedTokenizer from
+            tokenizer_registry counts through its segment cache.
+
+    Returns:
+        callable: Function mapping a list of texts to their source-token counts.
+    """
+    if hasattr(tokenizer, "count_tokens"):
+        return tokenizer.count_tokens
+
+    def count(texts):
+        if not texts:
+            return []
+        encoded = tokenizer(list(texts), add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in encoded]
+
+    return count
+
+
+def _split_long_sentence(sentence, count_tokens, max_tokens, tokenizer=None):
+    words = sentence.split()
+    word_counts = count_tokens(words)
+    piece, piece_tokens = [], 0
+    for word, word_tokens in zip(words, word_counts):
+        if word_tokens > max_tokens:
+            if piece:
+                yield " ".join(piece)
+                piece, piece_tokens = [], 0
+            if tokenizer is None:
+                yield word
+                continue
+            # A single "word" (e.g. text without spaces) over the limit: cut on token boundaries
+            ids = tokenizer.encode(word, add_special_tokens=False)
+            for start in range(0, len(ids), max_tokens):
+                yield tokenizer.decode(ids[start : start + max_tokens], skip_special_tokens=True)
+            continue
+        if piece and piece_tokens + word_tokens > max_tokens:
+            yield " ".join(piece)
+            piece, piece_tokens = [], 0
+        piece.append(word)
+        piece_tokens += word_tokens
+    if piece:
+        yield " ".join(piece)
+
+
+def pack_sentences(sentences, count_tokens, max_tokens=512, tokenizer=None):
+    """
+    Greedily pack sentences into chunks of at most max_tokens source tokens.
+
+    Args:
+        sentences (list): Sentences in reading order.
+        count_tokens (callable): Batched token counter (see tokenizer_counter).
+        max_tokens (int): Maximum source tokens per chunk.
+        tokenizer: Optional tokenizer used to cut sentences that contain no spaces.
+
+    Yields:
+        str: Packed chunks in reading order.
+    """
+    chunk, chunk_tokens = [], 0
+    for sentence, sentence_tokens in zip(sentences, count_tokens(sentences)):
+        if sentence_tokens > max_tokens:
+            if chunk:
+                yield " ".join(chunk)
+                chunk, chunk_tokens = [], 0
+            yield from _split_long_sentence(sentence, count_tokens, max_tokens, tokenizer)
+            continue
+        # +1 accounts for the space joining two sentences
+        if chunk and chunk_tokens + sentence_tokens + 1 > max_tokens:
+            yield " ".join(chunk)
+            chunk, chunk_tokens = [], 0
+        chunk.append(sentence)
+        chunk_tokens += sentence_tokens + (1 if len(chunk) > 1 else 0)
+    if chunk:
+        yield " ".join(chunk)
+
+
+def segment_text(text, tokenizer, max_tokens=512):
+    """
+    Split a text into model inputs of at most max_tokens source tokens.
+
+    Args:
+        text (str): Input text.
+        tokenizer: Tokenizer of the model that will translate the chunks.
+        max_tokens (int): Maximum source tokens per chunk.
+
+    Returns:
+        list: Text chunks.
+    """
+    return list(
+        pack_sentences(split_sentences(text), tokenizer_counter(tokenizer), max_tokens, tokenizer)
+    )
+
+
+def iter_line_chunks(lines, tokenizer, max_tokens=512):
+    """
+    Stream chunks for every line of a book.
+
+    Args:
+        lines (iterable): Lines (paragraphs) of the book.
+        tokenizer: Tokenizer of the model that will translate the chunks.
+        max_tokens (int): Maximum source tokens per chunk.
+
+    Yields:
+        tuple: (line index, chunk). Blank lines yield (line index, None).
+    """
+    count_tokens = tokenizer_counter(tokenizer)
+    for index, line in enumerate(lines):
+        if not line.strip():
+            yield index, None
+            continue
+        for chunk in pack_sentences(split_sentences(line), count_tokens, max_tokens, tokenizer):
+            yield index, chunk
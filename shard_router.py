@@ -0,0 +1,335 @@
+"""
+Multi-process model sharding for the translation API.
+
+With SHARD_LAYOUT set, the API process does not load any model itself. It starts worker processes
+that each own a group of language pairs and load only the models those pairs go through (direct,
+pivot or m2m100), and dispatches every request by its source_lang-target_lang pair to the least
+loaded worker owning that pair. Pre/post-processing of different workers runs in parallel instead
+of contending for one GIL, and a hot pair can be given several replicas. Workers that crash are
+restarted and their in-flight requests fail with an error instead of hanging. Metrics recorded in
+the workers are collected by the router on each /metrics scrape (see broadcast).
+
+    SHARD_LAYOUT          Worker groups separated by ";". Each group lists the pairs it owns,
+                          optionally followed by "*N" for N replicas. A group "*" takes every
+                          pair not listed elsewhere; without one, unlisted pairs go to the least
+                          loaded worker overall. Example: "en-vi*2;vi-en,en-fr,fr-en;en-ko,en-ja;*"
+    SHARD_WORKER_THREADS  Requests one worker handles concurrently, so the per-pair micro-batcher
+                          can still group them (default 4).
+    SHARD_TIMEOUT         Seconds to wait for a worker's answer (default 600).
+    SHARD_METRICS_TIMEOUT Seconds a /metrics scrape waits for each worker's metrics (default 5).
+
+Workers are started with the "spawn" method: the router already runs request, batcher and metrics
+threads, and a forked child could inherit a lock one of them holds and deadlock. Each worker sends
+its answers over a pipe of its own, so a worker killed in the middle of a write cannot block the
+answers of the others.
+"""
+
+import itertools
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing.connection import wait
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ANY_PAIR = "*"
+
+# Functions of main.py a worker can be asked to run
+ROUTED_METHODS = {"translate_with_timing", "translate_texts", "metrics_text"}
+
+
+def parse_layout(layout):
+    """
+    Parse SHARD_LAYOUT into worker groups.
+
+    Args:
+        layout (str): Layout string, e.g. "en-vi*2;vi-en,en-fr;*".
+
+    Returns:
+        list: (pairs, replicas) per group, where pairs is a tuple of pairs or ("*",).
+    """
+    groups = []
+    for group in layout.split(";"):
+        group = group.strip()
+        if not group:
+            continue
+        if group == ANY_PAIR:
+            groups.append(((ANY_PAIR,), 1))
+            continue
+        pairs, _, replicas = group.partition("*")
+        pair_list = tuple(pair.strip() for pair in pairs.split(",") if pair.strip())
+        groups.append((pair_list, int(replicas) if replicas else 1))
+    return groups
+
+
+def worker_main(worker_id, pairs, requests, responses, threads):
+    """
+    Entry point of a worker process: load the models of its pairs, then serve requests.
+
+    Args:
+        worker_id (int): Worker number, used in logs.
+        pairs (tuple): Pairs the worker owns, or ("*",).
+        requests: Queue of (request_id, method, args) tuples; None stops the worker.
+        responses: Connection the worker sends (request_id, result, error) tuples on.
+        threads (int): Requests handled concurrently.
+    """
+    os.environ["SHARD_WORKER_ID"] = str(worker_id)
+    # Spawning re-imports the router's entry script, which may have imported main in router mode;
+    # import a fresh one in worker mode
+    sys.modules.pop("main", None)
+    import main
+
+    if pairs != (ANY_PAIR,):
+        main.startup_shard(pairs)
+    print(f"Shard worker {worker_id} (pid {os.getpid()}) ready for {', '.join(pairs)}")
+
+    send_lock = threading.Lock()
+
+    def respond(response):
+        # Messages of concurrent requests must not interleave on the pipe
+        with send_lock:
+            responses.send(response)
+
+    def handle(request_id, method, args):
+        try:
+            result = getattr(main, method)(*args)
+        except Exception as e:
+            respond((request_id, None, f"{type(e).__name__}: {e}"))
+            return
+        respond((request_id, result, None))
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        while True:
+            item = requests.get()
+            if item is None:
+                break
+            executor.submit(handle, *item)
+
+
+class ShardWorker:
+    """
+    A worker process together with its request queue and load counters.
+
+    Args:
+        worker_id (int): Worker number.
+        pairs (tuple): Pairs the worker owns, or ("*",).
+    """
+
+    def __init__(self, worker_id, pairs):
+        self.worker_id = worker_id
+        self.pairs = pairs
+        self.process = None
+        self.requests = None
+        self.responses = None
+        self.in_flight = 0
+        self.handled = 0
+        self.restarts = 0
+
+    def start(self, context, threads):
+        if self.responses is not None:
+            self.responses.close()
+        self.requests = context.Queue()
+        self.responses, worker_end = context.Pipe(duplex=False)
+        self.process = context.Process(
+            target=worker_main,
+            args=(self.worker_id, self.pairs, self.requests, worker_end, threads),
+            name=f"shard-worker-{self.worker_id}",
+            daemon=True,
+        )
+        self.process.start()
+        # Only the worker holds the sending end, so its exit shows up as EOF on self.responses
+        worker_end.close()
+
+    def owns(self, pair):
+        return pair in self.pairs or ANY_PAIR in self.pairs
+
+
+class ShardRouter:
+    """
+    Start shard workers and route requests to them by language pair.
+
+    Args:
+        layout (str): SHARD_LAYOUT string.
+        threads (int): Requests each worker handles concurrently.
+        timeout (float): Seconds to wait for an answer.
+    """
+
+    def __init__(self, layout, threads=4, timeout=600):
+        self.threads = threads
+        self.timeout = timeout
+        self._context = multiprocessing.get_context("spawn")
+        self._pending = {}
+        self._request_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+        worker_ids = itertools.count()
+        self.workers = [
+            ShardWorker(next(worker_ids), pairs)
+            for pairs, replicas in parse_layout(layout)
+            for _ in range(replicas)
+        ]
+        if not self.workers:
+            raise ValueError(f"SHARD_LAYOUT '{layout}' defines no workers")
+        for worker in self.workers:
+            worker.start(self._context, self.threads)
+
+        threading.Thread(target=self._collect_responses, daemon=True, name="shard-responses").start()
+        threading.Thread(target=self._watch_workers, daemon=True, name="shard-watchdog").start()
+
+    def _pick_worker(self, pair):
+        # Caller holds self._lock
+        candidates = [w for w in self.workers if pair in w.pairs]
+        if not candidates:
+            candidates = [w for w in self.workers if w.owns(pair)] or self.workers
+        return min(candidates, key=lambda w: w.in_flight)
+
+    def submit(self, pair, method, *args):
+        """
+        Send a call to the least loaded worker owning a pair.
+
+        Args:
+            pair (str): Language pair such as "en-vi".
+            method (str): Function of main.py to run (see ROUTED_METHODS).
+            *args: Arguments of the function.
+
+        Returns:
+            Future: Resolves to the function's result.
+        """
+        if method not in ROUTED_METHODS:
+            raise ValueError(f"Method '{method}' cannot be routed to shard workers")
+        future = Future()
+        with self._lock:
+            worker = self._pick_worker(pair)
+            request_id = next(self._request_ids)
+            self._pending[request_id] = (future, worker)
+            worker.in_flight += 1
+            worker.requests.put((request_id, method, args))
+        return future
+
+    def call(self, pair, method, *args):
+        """Run a call on a worker and wait for its result."""
+        return self.submit(pair, method, *args).result(timeout=self.timeout)
+
+    def broadcast(self, method, *args, timeout=None):
+        """
+        Run a call on every worker and wait for their results.
+
+        Args:
+            method (str): Function of main.py to run (see ROUTED_METHODS).
+            *args: Arguments of the function.
+            timeout (float): Seconds to wait for each worker; defaults to the router's timeout.
+
+        Returns:
+            dict: Result by worker id; workers that failed or did not answer in time are left out.
+        """
+        if method not in ROUTED_METHODS:
+            raise ValueError(f"Method '{method}' cannot be routed to shard workers")
+        futures = {}
+        with self._lock:
+            for worker in self.workers:
+                future = Future()
+                request_id = next(self._request_ids)
+                self._pending[request_id] = (future, worker)
+                worker.in_flight += 1
+                worker.requests.put((request_id, method, args))
+                futures[worker.worker_id] = future
+
+        results = {}
+        for worker_id, future in futures.items():
+            try:
+                results[worker_id] = future.result(timeout=timeout or self.timeout)
+            except Exception as e:
+                print(f"Shard worker {worker_id} did not answer {method}: {e}")
+        return results
+
+    def _finish(self, request_id):
+        # Caller holds self._lock
+        future, worker = self._pending.pop(request_id, (None, None))
+        if worker is not None:
+            worker.in_flight -= 1
+            worker.handled += 1
+        return future
+
+    def _collect_responses(self):
+        # Pipes of exited workers stay readable (EOF) until the watchdog replaces them
+        closed = set()
+        while not self._stopping.is_set():
+            with self._lock:
+                connections = [w.responses for w in self.workers if w.responses not in closed]
+            if not connections:
+                self._stopping.wait(0.1)
+                continue
+            try:
+                ready = wait(connections, timeout=1)
+            except (OSError, ValueError):
+                # A pipe was closed by a restart while waiting on it
+                continue
+            for connection in ready:
+                try:
+                    request_id, result, error = connection.recv()
+                except (EOFError, OSError):
+                    # The worker exited; the watchdog fails its requests and restarts it
+                    closed.add(connection)
+                    continue
+                with self._lock:
+                    future = self._finish(request_id)
+                if future is None:
+                    continue
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(RuntimeError(error))
+
+    def _watch_workers(self):
+        while not self._stopping.wait(1):
+            for worker in self.workers:
+                if worker.process.is_alive() or self._stopping.is_set():
+                    continue
+                print(
+                    f"Shard worker {worker.worker_id} exited with code {worker.process.exitcode}, restarting"
+                )
+                with self._lock:
+                    failed = [
+                        request_id
+                        for request_id, (_, owner) in self._pending.items()
+                        if owner is worker
+                    ]
+                    futures = [self._finish(request_id) for request_id in failed]
+                    worker.restarts += 1
+                    worker.start(self._context, self.threads)
+                for future in futures:
+                    future.set_exception(RuntimeError(f"Shard worker {worker.worker_id} crashed"))
+
+    def stats(self):
+        """
+        Return per-worker routing statistics.
+
+        Returns:
+            list: Pairs, pid, in-flight and handled requests and restarts of each worker.
+        """
+        with self._lock:
+            return [
+                {
+                    "worker": worker.worker_id,
+                    "pairs": list(worker.pairs),
+                    "pid": worker.process.pid,
+                    "alive": worker.process.is_alive(),
+                    "in_flight": worker.in_flight,
+                    "handled": worker.handled,
+                    "restarts": worker.restarts,
+                }
+                for worker in self.workers
+            ]
+
+    def stop(self):
+        """Ask every worker to finish its queued requests and exit."""
+        self._stopping.set()
+        for worker in self.workers:
+            worker.requests.put(None)
+        for worker in self.workers:
+            worker.process.join(timeout=self.timeout)
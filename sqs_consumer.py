@@ -0,0 +1,199 @@
+"""
+Concurrent SQS consumer with long polling and a slot-based worker pool.
+
+The consumer only receives as many messages (up to 10 per call) as it has free compute slots, so a
+busy worker leaves the rest of the queue to other workers instead of hoarding messages. Each message
+runs in the pool with a heartbeat that keeps it invisible, and is deleted only when its handler
+returns. A handler that raises RejectMessage marks the message as one that can never succeed (e.g.
+invalid parameters); it is logged and deleted instead of being retried. On SIGTERM/SIGINT the
+consumer stops receiving and drains the jobs already in flight.
+
+The SQS client is passed in, so the consumer can be driven by any boto3-compatible stand-in (e.g. a
+moto mock or an in-process fake) through poll_once().
+
+    WORKER_SLOTS            Number of jobs processed concurrently (default 1).
+    SQS_WAIT_TIME_SECONDS   Long-poll duration of each receive call (default 20).
+"""
+
+import json
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MAX_RECEIVE_MESSAGES = 10
+
+
+class RejectMessage(Exception):
+    """Raised by a handler for a message that will never succeed; it is deleted, not retried."""
+
+
+class VisibilityHeartbeat:
+    """
+    Keep an in-flight message invisible by extending its visibility timeout periodically.
+
+    Args:
+        sqs: SQS client.
+        queue_url (str): Queue URL.
+        receipt_handle (str): Receipt handle of the message.
+        timeout (int): Visibility timeout in seconds; it is renewed every third of it.
+    """
+
+    def __init__(self, sqs, queue_url, receipt_handle, timeout=300):
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.receipt_handle = receipt_handle
+        self.timeout = timeout
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.timeout / 3):
+            try:
+                self.sqs.change_message_visibility(
+                    QueueUrl=self.queue_url,
+                    ReceiptHandle=self.receipt_handle,
+                    VisibilityTimeout=self.timeout,
+                )
+            except Exception as e:
+                print(f"Failed to extend message visibility: {e}")
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+
+class SQSConsumer:
+    """
+    Receive messages with long polling and process them on a bounded worker pool.
+
+    Args:
+        sqs: SQS client.
+        queue_url (str): Queue URL.
+        handler (callable): Function called with the decoded JSON body of each message.
+        slots (int): Number of messages processed concurrently.
+        wait_time (int): Long-poll duration of each receive call in seconds.
+        visibility_timeout (int): Visibility timeout of in-flight messages in seconds.
+    """
+
+    def __init__(self, sqs, queue_url, handler, slots=1, wait_time=20, visibility_timeout=300):
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.handler = handler
+        self.slots = slots
+        self.wait_time = wait_time
+        self.visibility_timeout = visibility_timeout
+        self._free_slots = threading.Semaphore(slots)
+        self._executor = ThreadPoolExecutor(max_workers=slots)
+        self._stopping = threading.Event()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _acquire_slots(self):
+        # Block until at least one slot is free, then take every other free slot without waiting
+        while not self._free_slots.acquire(timeout=1):
+            if self._stopping.is_set():
+                return 0
+        acquired = 1
+        while acquired < MAX_RECEIVE_MESSAGES and self._free_slots.acquire(blocking=False):
+            acquired += 1
+        return acquired
+
+    def poll_once(self, wait_time=None):
+        """
+        Receive up to as many messages as there are free slots and dispatch them.
+
+        Args:
+            wait_time (int): Long-poll duration; defaults to the consumer's wait_time.
+
+        Returns:
+            int: Number of messages dispatched.
+        """
+        acquired = self._acquire_slots()
+        if not acquired:
+            return 0
+        try:
+            response = self.sqs.receive_message(
+                QueueUrl=self.queue_url,
+                AttributeNames=["All"],
+                MaxNumberOfMessages=acquired,
+                MessageAttributeNames=["All"],
+                VisibilityTimeout=self.visibility_timeout,
+                WaitTimeSeconds=self.wait_time if wait_time is None else wait_time,
+            )
+            messages = response.get("Messages", [])
+        except Exception:
+            self._release(acquired)
+            raise
+
+        # Give back the slots that did not get a message
+        self._release(acquired - len(messages))
+        for message in messages:
+            with self._lock:
+                self._in_flight += 1
+            self._executor.submit(self._process, message)
+        return len(messages)
+
+    def _release(self, count):
+        for _ in range(count):
+            self._free_slots.release()
+
+    def _process(self, message):
+        try:
+            with VisibilityHeartbeat(
+                self.sqs, self.queue_url, message["ReceiptHandle"], self.visibility_timeout
+            ):
+                self.handler(json.loads(message["Body"]))
+            # Only a finished job leaves the queue; failed jobs become visible again and are retried
+            self.sqs.delete_message(QueueUrl=self.queue_url, ReceiptHandle=message["ReceiptHandle"])
+        except RejectMessage as e:
+            print(f"Rejected message {message.get('MessageId')}: {e}")
+            try:
+                self.sqs.delete_message(QueueUrl=self.queue_url, ReceiptHandle=message["ReceiptHandle"])
+            except Exception as delete_error:
+                print(f"Failed to delete rejected message {message.get('MessageId')}: {delete_error}")
+        except Exception as e:
+            print(f"An error occurred while processing message {message.get('MessageId')}: {e}")
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._release(1)
+
+    def in_flight(self):
+        """Return the number of messages currently being processed."""
+        with self._lock:
+            return self._in_flight
+
+    def run(self):
+        """Consume until stop() is called, then wait for the in-flight jobs to finish."""
+        print(f"Consuming {self.queue_url} with {self.slots} slots")
+        while not self._stopping.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"An error occurred while receiving messages: {e}")
+                self._stopping.wait(5)
+        print(f"Draining {self.in_flight()} in-flight jobs")
+        self._executor.shutdown(wait=True)
+
+    def stop(self, *_):
+        """Stop receiving new messages; run() returns once in-flight jobs are done."""
+        self._stopping.set()
+
+    def install_signal_handlers(self):
+        """Stop gracefully on SIGTERM and SIGINT."""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+
+def default_slots():
+    """Number of concurrent jobs from WORKER_SLOTS."""
+    return int(os.getenv("WORKER_SLOTS", "1"))
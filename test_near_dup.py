@@ -0,0 +1,62 @@
+"""
+Tests for the MinHash/LSH near-duplicate stage.
+
+Run with:
+    python -m pytest test_near_dup.py
+"""
+
+import unittest
+
+from near_dup import find_near_duplicates, minhash, shingles
+
+NUM_PERM = 128
+THRESHOLD = 0.85
+
+# A~B and B~C reach the threshold, A~C does not
+A = "the old lighthouse keeper walked along the rocky shore every evening before the storm arrived at the harbour"
+B = "the old lighthouse keeper walked along the rocky shore every evening before the rain arrived at the harbour"
+C = "the young lighthouse keeper walked along the rocky shore every evening before the rain arrived at the harbour"
+UNRELATED = "a completely different sentence about cooking rice with fresh vegetables and a little soy sauce"
+
+
+def estimated_similarity(left, right):
+    left_signature = minhash(shingles(left), NUM_PERM)
+    right_signature = minhash(shingles(right), NUM_PERM)
+    return sum(x == y for x, y in zip(left_signature, right_signature)) / NUM_PERM
+
+
+def dropped(drop, sentence_number):
+    return bool(drop[sentence_number >> 3] >> (sentence_number & 7) & 1)
+
+
+class NearDuplicateTest(unittest.TestCase):
+    def find(self, sentences):
+        return find_near_duplicates(
+            iter(sentences), threshold=THRESHOLD, num_perm=NUM_PERM, workers=1, shards=2
+        )
+
+    def test_corpus_is_chained(self):
+        self.assertGreaterEqual(estimated_similarity(A, B), THRESHOLD)
+        self.assertGreaterEqual(estimated_similarity(B, C), THRESHOLD)
+        self.assertLess(estimated_similarity(A, C), THRESHOLD)
+
+    def test_similarity_does_not_chain_through_dropped_sentences(self):
+        drop, stats = self.find([A, B, C])
+
+        self.assertFalse(dropped(drop, 0))
+        self.assertTrue(dropped(drop, 1))
+        # C only resembles B, which is dropped; it is not dropped in favour of A
+        self.assertFalse(dropped(drop, 2))
+        self.assertEqual(stats["removed_sentences"], 1)
+        self.assertEqual(stats["largest_clusters"], [{"sentence": 0, "size": 2}])
+
+    def test_exact_and_near_duplicates_are_dropped_under_the_first_occurrence(self):
+        drop, stats = self.find([UNRELATED, A, B, A, UNRELATED + "!"])
+
+        self.assertEqual([dropped(drop, i) for i in range(5)], [False, False, True, True, True])
+        self.assertEqual(stats["clusters"], 2)
+        self.assertEqual(stats["cluster_sizes"], {"2": 1, "3": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
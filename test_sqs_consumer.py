@@ -0,0 +1,168 @@
+"""
+Tests for sqs_consumer against an in-process SQS stand-in.
+
+Run with:
+    python -m pytest test_sqs_consumer.py
+"""
+
+import json
+import threading
+import time
+import unittest
+
+from sqs_consumer import RejectMessage, SQSConsumer
+
+QUEUE_URL = "https://sqs.local/queue"
+
+
+class FakeSQS:
+    """Minimal boto3-style SQS client: messages are invisible while received, until deleted or expired."""
+
+    def __init__(self, bodies=()):
+        self._lock = threading.Lock()
+        self.visible = []
+        self.in_flight = {}
+        self.deleted = []
+        self.receive_calls = []
+        self.visibility_changes = 0
+        self._ids = iter(range(1000000))
+        for body in bodies:
+            self.send(body)
+
+    def send(self, body):
+        message_id = str(next(self._ids))
+        self.visible.append(
+            {"MessageId": message_id, "ReceiptHandle": f"rh-{message_id}", "Body": json.dumps(body)}
+        )
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages, **kwargs):
+        with self._lock:
+            self.receive_calls.append(MaxNumberOfMessages)
+            messages = self.visible[:MaxNumberOfMessages]
+            del self.visible[:MaxNumberOfMessages]
+            for message in messages:
+                self.in_flight[message["ReceiptHandle"]] = message
+        return {"Messages": messages}
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        with self._lock:
+            self.deleted.append(json.loads(self.in_flight.pop(ReceiptHandle)["Body"]))
+
+    def change_message_visibility(self, QueueUrl, ReceiptHandle, VisibilityTimeout):
+        with self._lock:
+            self.visibility_changes += 1
+
+    def expire(self):
+        """Make every received but undeleted message visible again (visibility timeout elapsed)."""
+        with self._lock:
+            self.visible.extend(self.in_flight.values())
+            self.in_flight.clear()
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for condition")
+        time.sleep(0.01)
+
+
+class SQSConsumerTest(unittest.TestCase):
+    def test_deletes_message_after_handler_succeeds(self):
+        sqs = FakeSQS([{"job": 1}, {"job": 2}])
+        handled = []
+        consumer = SQSConsumer(sqs, QUEUE_URL, handled.append, slots=4, wait_time=0)
+
+        self.assertEqual(consumer.poll_once(), 2)
+        wait_until(lambda: consumer.in_flight() == 0)
+
+        self.assertCountEqual(handled, [{"job": 1}, {"job": 2}])
+        self.assertCountEqual(sqs.deleted, [{"job": 1}, {"job": 2}])
+        self.assertEqual(sqs.in_flight, {})
+
+    def test_failed_message_is_kept_and_retried(self):
+        sqs = FakeSQS([{"job": 1}])
+        attempts = []
+
+        def handler(body):
+            attempts.append(body)
+            if len(attempts) == 1:
+                raise RuntimeError("transient failure")
+
+        consumer = SQSConsumer(sqs, QUEUE_URL, handler, slots=1, wait_time=0)
+        consumer.poll_once()
+        wait_until(lambda: consumer.in_flight() == 0)
+        self.assertEqual(sqs.deleted, [])
+
+        sqs.expire()
+        consumer.poll_once()
+        wait_until(lambda: consumer.in_flight() == 0)
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(sqs.deleted, [{"job": 1}])
+
+    def test_rejected_message_is_deleted_without_retry(self):
+        sqs = FakeSQS([{"job": 1}])
+
+        def handler(body):
+            raise RejectMessage("invalid tier")
+
+        consumer = SQSConsumer(sqs, QUEUE_URL, handler, slots=1, wait_time=0)
+        consumer.poll_once()
+        wait_until(lambda: consumer.in_flight() == 0)
+        self.assertEqual(sqs.deleted, [{"job": 1}])
+
+    def test_receives_only_as_many_messages_as_free_slots(self):
+        sqs = FakeSQS([{"job": i} for i in range(5)])
+        release = threading.Event()
+        consumer = SQSConsumer(sqs, QUEUE_URL, lambda body: release.wait(5), slots=2, wait_time=0)
+
+        self.assertEqual(consumer.poll_once(), 2)
+        self.assertEqual(sqs.receive_calls, [2])
+        self.assertEqual(len(sqs.visible), 3)
+
+        # With every slot busy, the next poll waits instead of receiving more messages
+        poller = threading.Thread(target=consumer.poll_once)
+        poller.start()
+        time.sleep(0.2)
+        self.assertEqual(sqs.receive_calls, [2])
+
+        release.set()
+        poller.join(5)
+        self.assertFalse(poller.is_alive())
+        self.assertEqual(len(sqs.receive_calls), 2)
+        self.assertLessEqual(sqs.receive_calls[1], 2)
+        wait_until(lambda: consumer.in_flight() == 0)
+
+    def test_heartbeat_extends_visibility_of_long_jobs(self):
+        sqs = FakeSQS([{"job": 1}])
+        consumer = SQSConsumer(
+            sqs, QUEUE_URL, lambda body: time.sleep(0.35), slots=1, wait_time=0, visibility_timeout=0.3
+        )
+        consumer.poll_once()
+        wait_until(lambda: consumer.in_flight() == 0)
+        self.assertGreaterEqual(sqs.visibility_changes, 1)
+        self.assertEqual(sqs.deleted, [{"job": 1}])
+
+    def test_run_drains_in_flight_jobs_on_stop(self):
+        sqs = FakeSQS([{"job": 1}])
+        started = threading.Event()
+        finished = []
+
+        def handler(body):
+            started.set()
+            time.sleep(0.2)
+            finished.append(body)
+
+        consumer = SQSConsumer(sqs, QUEUE_URL, handler, slots=1, wait_time=0)
+        runner = threading.Thread(target=consumer.run)
+        runner.start()
+        started.wait(5)
+        consumer.stop()
+        runner.join(5)
+        self.assertFalse(runner.is_alive())
+        self.assertEqual(finished, [{"job": 1}])
+        self.assertEqual(sqs.deleted, [{"job": 1}])
+
+
+if __name__ == "__main__":
+    unittest.main()
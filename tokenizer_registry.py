@@ -0,0 +1,232 @@
+"""
+Process-wide registry of model tokenizers.
+
+Each tokenizer is loaded once per model directory (the Rust-backed fast tokenizer when the model
+has one, the SentencePiece one otherwise) and shared by every translator of that model, whatever
+its device or compute type, and by the sentence packer. Encoding is batched, and the token ids
+of each segment are kept in an LRU cache, so repeated segments (headings, boilerplate, short
+dialogue lines) and the segments the packer has just counted are not tokenized again. Ids are
+stored as compact int32 arrays and the cache is bounded by its size in memory, so a few very long
+segments cannot make it grow without limit.
+
+    TOKENIZER_CACHE_MB   Memory used by the cached segments of each tokenizer (default 64, 0
+                         disables the cache).
+"""
+
+import os
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+
+from transformers import AutoTokenizer
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class SharedTokenizer:
+    """
+    Hugging Face tokenizer with batched, cached encoding.
+
+    Attribute access and calls are forwarded to the wrapped tokenizer, so a SharedTokenizer can be
+    used wherever the tokenizer itself is expected.
+
+    Args:
+        tokenizer: The Hugging Face tokenizer.
+        cache_mb (float): Maximum memory used by cached segments in MB, 0 to disable the cache.
+    """
+
+    def __init__(self, tokenizer, cache_mb=64):
+        self.tokenizer = tokenizer
+        self.max_cache_bytes = int(cache_mb * 1024 * 1024)
+        self.num_special_tokens = tokenizer.num_special_tokens_to_add()
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def __getattr__(self, name):
+        # Only called for attributes SharedTokenizer does not define itself
+        if name == "tokenizer":
+            raise AttributeError(name)
+        return getattr(self.tokenizer, name)
+
+    def __call__(self, *args, **kwargs):
+        return self.tokenizer(*args, **kwargs)
+
+    def encode_batch(self, texts):
+        """
+        Tokenize texts into model input tokens, special tokens included.
+
+        Args:
+            texts (list): Texts to encode.
+
+        Returns:
+            list: One list of token strings per text.
+        """
+        return [self.tokenizer.convert_ids_to_tokens(ids.tolist()) for ids in self._encode_ids(texts)]
+
+    def _encode_ids(self, texts):
+        # Token ids of each text as an array('i'), from the cache or from one batched call
+        ids = [None] * len(texts)
+        missing = {}
+        with self._lock:
+            for i, text in enumerate(texts):
+                cached = self._cache.get(text)
+                if cached is None:
+                    missing.setdefault(text, []).append(i)
+                else:
+                    self._cache.move_to_end(text)
+                    ids[i] = cached
+            self._stats["hits"] += len(texts) - sum(len(indexes) for indexes in missing.values())
+            self._stats["misses"] += sum(len(indexes) for indexes in missing.values())
+
+        if missing:
+            # One call for every segment not seen yet; fast tokenizers encode it in parallel
+            encoded = [array("i", text_ids) for text_ids in self.tokenizer(list(missing))["input_ids"]]
+            for (text, indexes), text_ids in zip(missing.items(), encoded):
+                for i in indexes:
+                    ids[i] = text_ids
+            if self.max_cache_bytes:
+                with self._lock:
+                    for text, text_ids in zip(missing, encoded):
+                        self._cache_put(text, text_ids)
+        return ids
+
+    def _cache_put(self, text, ids):
+        # Caller holds self._lock; evicts least recently used segments past the memory budget
+        size = sys.getsizeof(text) + sys.getsizeof(ids)
+        if size > self.max_cache_bytes:
+            return
+        previous = self._cache.pop(text, None)
+        if previous is not None:
+            self._cache_bytes -= sys.getsizeof(text) + sys.getsizeof(previous)
+        self._cache[text] = ids
+        self._cache_bytes += size
+        while self._cache_bytes > self.max_cache_bytes:
+            old_text, old_ids = self._cache.popitem(last=False)
+            self._cache_bytes -= sys.getsizeof(old_text) + sys.getsizeof(old_ids)
+
+    def decode_batch(self, token_lists, **kwargs):
+        """
+        Turn output token sequences back into text.
+
+        Args:
+            token_lists (list): One list of token strings per output.
+            **kwargs: Passed to batch_decode, e.g. skip_special_tokens=True.
+
+        Returns:
+            list: Decoded texts.
+        """
+        ids = [self.tokenizer.convert_tokens_to_ids(tokens) for tokens in token_lists]
+        return self.tokenizer.batch_decode(ids, **kwargs)
+
+    def count_tokens(self, texts):
+        """Return the source-token count of each text, special tokens excluded."""
+        return [len(ids) - self.num_special_tokens for ids in self._encode_ids(list(texts))]
+
+    def stats(self):
+        """
+        Return cache statistics.
+
+        Returns:
+            dict: Hits, misses, hit rate, cached segments and their size, and whether the
+            tokenizer is fast.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            cached = len(self._cache)
+            cached_bytes = self._cache_bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["cached_segments"] = cached
+        stats["cached_mb"] = cached_bytes / 1024 / 1024
+        stats["is_fast"] = bool(getattr(self.tokenizer, "is_fast", False))
+        return stats
+
+
+def attach_tokenizer(translator, shared):
+    """
+    Make an hf_hub_ctranslate2 translator encode and decode through a shared tokenizer.
+
+    The translator's generate() runs tokenize_encode, _forward and tokenize_decode; the first and
+    last are replaced on the instance with the batched, cached versions.
+
+    Args:
+        translator: TranslatorCT2fromHfHub instance.
+        shared (SharedTokenizer): Tokenizer of the translator's model.
+
+    Returns:
+        The same translator.
+    """
+
+    def tokenize_encode(text, *args, **kwargs):
+        return shared.encode_batch(list(text))
+
+    def tokenize_decode(tokens_out, *args, **kwargs):
+        return shared.decode_batch([result.hypotheses[0] for result in tokens_out], **kwargs)
+
+    translator.tokenizer = shared
+    translator.tokenize_encode = tokenize_encode
+    translator.tokenize_decode = tokenize_decode
+    return translator
+
+
+class TokenizerRegistry:
+    """
+    Thread-safe cache of shared tokenizers, one per model directory.
+
+    Args:
+        cache_mb (float): Memory used by the cached segments of each tokenizer in MB.
+    """
+
+    def __init__(self, cache_mb=64):
+        self.cache_mb = cache_mb
+        self._tokenizers = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def get(self, model_dir):
+        """
+        Return the shared tokenizer of a model, loading it on first use.
+
+        Args:
+            model_dir (str): Path to the model directory.
+
+        Returns:
+            SharedTokenizer: The tokenizer.
+        """
+        key = os.path.realpath(model_dir)
+        with self._lock:
+            shared = self._tokenizers.get(key)
+            if shared is not None:
+                return shared
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                shared = self._tokenizers.get(key)
+                if shared is not None:
+                    return shared
+            # use_fast falls back to the slow SentencePiece tokenizer for models without a fast one
+            tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
+            shared = SharedTokenizer(tokenizer, self.cache_mb)
+            with self._lock:
+                self._tokenizers[key] = shared
+        return shared
+
+    def stats(self):
+        """Return the cache statistics of every loaded tokenizer, keyed by model directory name."""
+        with self._lock:
+            tokenizers = dict(self._tokenizers)
+        return {os.path.basename(key): shared.stats() for key, shared in tokenizers.items()}
+
+
+# Shared registry used by the translator registry, the sentence packer and calibration
+tokenizer_registry = TokenizerRegistry(cache_mb=float(os.getenv("TOKENIZER_CACHE_MB", "64")))
+
+
+def get_tokenizer(model_dir):
+    """Return the shared tokenizer of a model."""
+    return tokenizer_registry.get(model_dir)
@@ -7,17 +7,16 @@ the translated text to a new file.
 
 import os
 import shutil
-import concurrent.futures
 import csv
-from hf_hub_ctranslate2 import (
-    MultiLingualTranslatorCT2fromHfHub,
-    TranslatorCT2fromHfHub,
-)
-from transformers import AutoTokenizer
 from dotenv import load_dotenv
-import re
 import time
-from tqdm import tqdm
+from translator_registry import get_translator, registry
+from tokenizer_registry import tokenizer_registry
+from translation_cache import cache
+from book_engine import SegmentDeduper, translate_book
+from line_joiner import iter_joined_lines
+from decoding_tiers import resolve_tier, tier_model_id, tier_options
+import metrics
 
 # Load environment variables
 load_dotenv()
@@ -49,116 +48,18 @@ direct_model_mapping = {
 }
 supported_langs = ["en", "vi"]
 
-# Initialize the tokenizer
-tokenizer = AutoTokenizer.from_pretrained("weights/ct2fast-mix-en-vi-4m")
+# Batching of whole-book translation
+BOOK_MAX_BATCH_SIZE = int(os.getenv("BOOK_MAX_BATCH_SIZE", "32"))
+BOOK_BATCH_TYPE = os.getenv("BOOK_BATCH_TYPE", "examples")
 
-
-def split_text(text, max_length):
-    """
-    Split a large text into smaller chunks based on sentence-ending punctuation.
-
-    Args:
-        text (str): The input text to split.
-        max_length (int): Maximum length of each chunk.
-
-    Returns:
-        list: List of text chunks.
-    """
-    sentences = re.split(r'(?<=\.|,|;|"|!|\?)\s+', text)
-    chunks = []
-    current_chunk = ""
-    current_length = 0
-
-    for sentence in sentences:
-        sentence_length = len(sentence)
-        if current_length + sentence_length + 1 > max_length:
-            chunks.append(current_chunk.strip())
-            current_chunk = sentence
-            current_length = sentence_length
-        else:
-            current_chunk += (" " + sentence) if current_chunk else sentence
-            current_length += sentence_length + 1
-
-    if current_chunk:
-        chunks.append(current_chunk.strip())
-
-    return chunks
-
-
-def translate_with_timing(text_chunk, source_lang, target_lang):
-    """
-    Translate a text chunk using a specific translation model and measure the timing.
-
-    Args:
-        text_chunk (str): The text chunk to translate.
-        source_lang (str): Source language code.
-        target_lang (str): Target language code.
-
-    Returns:
-        str: Translated text.
-    """
-
-    def perform_translation(text_chunk, model_dir):
-        model = TranslatorCT2fromHfHub(
-            model_name_or_path=model_dir,
-            device="cuda",
-            compute_type="int8_float16",
-            tokenizer=AutoTokenizer.from_pretrained(model_dir),
-        )
-        translated_text = model.generate(text=text_chunk)
-        return translated_text
-
-    translated_text = perform_translation(
-        text_chunk, direct_model_mapping[f"{source_lang}-{target_lang}"]
-    )
-
-    return translated_text
-
-
-def remove_line(file_path):
-    """
-    Remove unnecessary line breaks from a text file.
-
-    Args:
-        file_path (str): Path to the input text file.
-    """
-    with open(file_path, "r", encoding="utf-8") as file:
-        lines = file.readlines()
-
-    processed_lines = []
-    for i, line in enumerate(lines):
-        if line.strip() == "":
-            processed_lines.append(line)
-        else:
-            if i + 1 < len(lines) and lines[i + 1].strip() == "":
-                processed_lines.append(line)
-            else:
-                processed_lines.append(line.rstrip() + " ")
-
-    processed_content = "".join(processed_lines)
-
-    with open(file_path, "w", encoding="utf-8") as file:
-        file.write(processed_content)
-
-
-def process_chunk(index, chunk, source_lang, target_lang):
-    """
-    Translate a single chunk of text.
-
-    Args:
-        index (int): Index of the chunk.
-        chunk (str): Text chunk to translate.
-        source_lang (str): Source language code.
-        target_lang (str): Target language code.
-
-    Returns:
-        tuple: Index and translated chunk.
-    """
-    translated_chunk = translate_with_timing(chunk, source_lang, target_lang)
-    return index, translated_chunk
-
-
-def process_file(local_file_path, source_lang, target_lang):
+def process_file(
+    local_file_path,
+    source_lang,
+    target_lang,
+    max_batch_size=BOOK_MAX_BATCH_SIZE,
+    batch_type=BOOK_BATCH_TYPE,
+    tier=None,
+):
     """
     Process a text file by removing line breaks, splitting text into chunks, translating chunks,
     and writing the translated text to a new file.
@@ -167,51 +68,53 @@ def process_file(local_file_path, source_lang, target_lang):
         local_file_path (str): Path to the input text file.
         source_lang (str): Source language code.
         target_lang (str): Target language code.
+        max_batch_size (int): Examples per batch, or padded tokens per batch when batch_type
+            is "tokens".
+        batch_type (str): "examples" or "tokens".
+        tier (str): Decoding tier ("fast", "balanced" or "best"); defaults to DEFAULT_TIER.
     """
     start_time = time.time()
 
-    # Remove unnecessary line breaks from the file
-    remove_line(local_file_path)
-
-    # Read the file content
+    # Read the file content, joining the wrapped lines of each paragraph (the file is left as is)
     with open(local_file_path, "r", encoding="utf-8") as file:
-        lines = file.readlines()
+        lines = list(iter_joined_lines(file))
 
     read_time = time.time()
 
-    translated_lines = []
-    total_chunks = 0
-    for line in tqdm(lines, desc="Translating lines"):
-        if not line.strip():
-            translated_lines.append("\n")
-        else:
-            # Split line into chunks for translation
-            chunks = split_text(line, 512)
-            total_chunks += len(chunks)
-            max_threads = 32
-            translated_chunks = [None] * len(chunks)
-
-            # Translate chunks concurrently
-            with concurrent.futures.ThreadPoolExecutor(
-                max_workers=max_threads
-            ) as executor:
-                futures = [
-                    executor.submit(
-                        process_chunk, index, chunk, source_lang, target_lang
-                    )
-                    for index, chunk in enumerate(chunks)
-                ]
-                for future in concurrent.futures.as_completed(futures):
-                    try:
-                        index, translated_chunk = future.result()
-                        translated_chunks[index] = translated_chunk
-                    except Exception as e:
-                        print(f"Error processing chunk: {e}")
-
-            translated_lines.append(" ".join(filter(None, translated_chunks)) + "\n")
+    pair = f"{source_lang}-{target_lang}"
+    tier = resolve_tier(tier)
+    model_id = tier_model_id(os.path.basename(direct_model_mapping[pair]), tier)
+    translator = get_translator(pair, direct_model_mapping[pair])
+    metrics.record_translation(pair, "direct", tier)
+    decoding_options = tier_options(tier)
+
+    def translate_batch(chunks):
+        # Only chunks missing from the translation memory are decoded
+        return cache.translate(
+            model_id,
+            pair,
+            chunks,
+            lambda misses: translator.generate(text=misses, **decoding_options),
+        )
+
+    # Bucket every segment of the book by length and decode in dense batches
+    # Repeated segments (headings, separators, license text) are decoded once per book
+    deduper = SegmentDeduper()
+    translated_lines, total_chunks = translate_book(
+        lines,
+        translate_batch,
+        translator.tokenizer,
+        max_tokens=512,
+        max_batch_size=max_batch_size,
+        batch_type=batch_type,
+        deduper=deduper,
+    )
 
     translate_time = time.time()
-    print(f"Time to translate all chunks: {translate_time - read_time:.2f} seconds")
+    print(
+        f"Time to translate all {total_chunks} chunks: {translate_time - read_time:.2f} seconds"
+    )
+    print(f"Segment deduplication: {deduper.summary()}")
 
     translated_content = "".join(translated_lines)
 
@@ -228,6 +131,9 @@ def process_file(local_file_path, source_lang, target_lang):
     write_time = time.time()
     print(f"Time to write file: {write_time - translate_time:.2f} seconds")
     print(f"Total time for processing file: {write_time - start_time:.2f} seconds")
+    print(f"Model cache stats: {registry.stats()}")
+    print(f"Translation cache stats: {cache.stats()}")
+    print(f"Tokenizer cache stats: {tokenizer_registry.stats()}")
 
     print(f"Translated file saved to '{translated_file_path}'")
 
@@ -295,4 +201,6 @@ def process_local_books():
 
 
 if __name__ == "__main__":
+    metrics.start_exporter()
     process_local_books()
+    metrics.export_once()
@@ -0,0 +1,237 @@
+"""
+Persistent segment-level translation memory.
+
+Translations are stored in a local SQLite database keyed by a hash of (model id, pair, normalized
+segment), so repeated segments such as Gutenberg license boilerplate and chapter headings are only
+decoded once across the API, the SQS worker and the batch book translator. The database runs in WAL
+mode so several processes can share one file. When the number of entries exceeds the cap, the
+least recently used entries are evicted.
+
+    TRANSLATION_CACHE_PATH          SQLite file, empty to disable the cache (default translation_cache.db).
+    TRANSLATION_CACHE_MAX_ENTRIES   Maximum number of stored segments (default 1000000).
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Variables are expanded per statement; stay well below SQLite's limit
+_SQL_CHUNK_SIZE = 500
+
+
+def normalize_segment(segment):
+    """Collapse whitespace so that differently wrapped copies of a segment share one entry."""
+    return re.sub(r"\s+", " ", segment).strip()
+
+
+def segment_key(model_id, pair, segment):
+    """
+    Build the cache key for a segment.
+
+    Args:
+        model_id (str): Identifier of the model producing the translation.
+        pair (str): Language pair such as "en-vi".
+        segment (str): Source segment.
+
+    Returns:
+        str: Hex digest identifying the (model, pair, segment) combination.
+    """
+    raw = f"{model_id}\0{pair}\0{normalize_segment(segment)}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class TranslationCache:
+    """
+    SQLite-backed translation memory with bulk lookup/insert and LRU eviction.
+
+    Args:
+        path (str): Path to the SQLite database file.
+        max_entries (int): Maximum number of stored segments.
+    """
+
+    def __init__(self, path, max_entries=1000000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "inserts": 0, "evictions": 0}
+
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS translations "
+            "(key TEXT PRIMARY KEY, translation TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used)"
+        )
+        connection.commit()
+        self._entries = connection.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, model_id, pair, segments):
+        """
+        Look up a batch of segments.
+
+        Args:
+            model_id (str): Identifier of the model.
+            pair (str): Language pair.
+            segments (list): Source segments.
+
+        Returns:
+            list: Cached translation for each segment, or None where there is no entry.
+        """
+        keys = [segment_key(model_id, pair, segment) for segment in segments]
+        connection = self._connection()
+        found = {}
+        for start in range(0, len(keys), _SQL_CHUNK_SIZE):
+            chunk = keys[start : start + _SQL_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            rows = connection.execute(
+                f"SELECT key, translation FROM translations WHERE key IN ({placeholders})",
+                chunk,
+            ).fetchall()
+            found.update(rows)
+
+        if found:
+            now = time.time()
+            connection.executemany(
+                "UPDATE translations SET last_used = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+            connection.commit()
+
+        results = [found.get(key) for key in keys]
+        hits = sum(1 for result in results if result is not None)
+        with self._lock:
+            self._stats["hits"] += hits
+            self._stats["misses"] += len(results) - hits
+        return results
+
+    def put_many(self, model_id, pair, segments, translations):
+        """
+        Store a batch of translations.
+
+        Args:
+            model_id (str): Identifier of the model.
+            pair (str): Language pair.
+            segments (list): Source segments.
+            translations (list): Translation of each segment; None entries (failed decodes) are skipped.
+        """
+        now = time.time()
+        rows = [
+            (segment_key(model_id, pair, segment), translation, now)
+            for segment, translation in zip(segments, translations)
+            if translation is not None
+        ]
+        connection = self._connection()
+        connection.executemany(
+            "INSERT OR REPLACE INTO translations (key, translation, last_used) VALUES (?, ?, ?)",
+            rows,
+        )
+        connection.commit()
+        with self._lock:
+            self._stats["inserts"] += len(rows)
+            self._entries += len(rows)
+            over_limit = self._entries > self.max_entries
+        if over_limit:
+            self._evict()
+
+    def _evict(self):
+        connection = self._connection()
+        # Other processes write to the same file, so recount before deleting
+        entries = connection.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        # Evict down to 90% of the cap so eviction does not run on every insert
+        excess = entries - int(self.max_entries * 0.9)
+        if excess > 0 and entries > self.max_entries:
+            connection.execute(
+                "DELETE FROM translations WHERE key IN "
+                "(SELECT key FROM translations ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            connection.commit()
+            entries -= excess
+            with self._lock:
+                self._stats["evictions"] += excess
+        with self._lock:
+            self._entries = entries
+
+    def translate(self, model_id, pair, segments, translate_batch):
+        """
+        Translate segments, decoding only the ones missing from the cache.
+
+        Args:
+            model_id (str): Identifier of the model.
+            pair (str): Language pair.
+            segments (list): Source segments.
+            translate_batch (callable): Function translating a list of segments.
+
+        Returns:
+            list: Translation of each segment, in input order.
+        """
+        results = self.get_many(model_id, pair, segments)
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            missing_segments = [segments[i] for i in missing]
+            translations = translate_batch(missing_segments)
+            self.put_many(model_id, pair, missing_segments, translations)
+            for i, translation in zip(missing, translations):
+                results[i] = translation
+        return results
+
+    def stats(self):
+        """
+        Return cache statistics.
+
+        Returns:
+            dict: Hit/miss/insert/eviction counters, hit rate and entry count.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self._entries
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+class NullTranslationCache:
+    """Drop-in replacement used when the cache is disabled."""
+
+    def get_many(self, model_id, pair, segments):
+        return [None] * len(segments)
+
+    def put_many(self, model_id, pair, segments, translations):
+        pass
+
+    def translate(self, model_id, pair, segments, translate_batch):
+        return translate_batch(segments)
+
+    def stats(self):
+        return {}
+
+
+def open_cache():
+    """Open the shared translation cache configured by the environment."""
+    path = os.getenv("TRANSLATION_CACHE_PATH", "translation_cache.db")
+    if not path:
+        return NullTranslationCache()
+    max_entries = int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", "1000000"))
+    return TranslationCache(path, max_entries=max_entries)
+
+
+cache = open_cache()
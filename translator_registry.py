@@ -0,0 +1,193 @@
+"""
+Process-wide registry of CTranslate2 translation models.
+
+Each model is loaded once per (pair, device, compute_type) and kept resident so that requests
+only pay for decoding. Device, compute type and thread layout come from inference_config. The
+total size of resident models is capped by MODEL_CACHE_MAX_MB; when a new model does not fit, the
+least recently used models are evicted first.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from hf_hub_ctranslate2 import TranslatorCT2fromHfHub
+from dotenv import load_dotenv
+
+from inference_config import ct2_kwargs, get_inference_config
+from tokenizer_registry import attach_tokenizer, get_tokenizer
+import metrics
+
+load_dotenv()
+
+
+def estimate_model_size(model_dir):
+    """
+    Estimate the memory footprint of a model from the size of its files on disk.
+
+    Args:
+        model_dir (str): Path to the converted model directory.
+
+    Returns:
+        int: Size in bytes.
+    """
+    total_size = 0
+    for root, _, files in os.walk(model_dir):
+        for file_name in files:
+            total_size += os.path.getsize(os.path.join(root, file_name))
+    return total_size
+
+
+def load_translator(model_dir, config):
+    """
+    Load a CTranslate2 translator from a local model directory, using the model's shared tokenizer.
+
+    Args:
+        model_dir (str): Path to the converted model directory.
+        config (dict): Inference settings from inference_config.get_inference_config.
+
+    Returns:
+        TranslatorCT2fromHfHub: The loaded translator.
+    """
+    shared = get_tokenizer(model_dir)
+    translator = TranslatorCT2fromHfHub(
+        model_name_or_path=model_dir,
+        tokenizer=shared.tokenizer,
+        **ct2_kwargs(config),
+    )
+    return attach_tokenizer(translator, shared)
+
+
+class TranslatorRegistry:
+    """
+    Thread-safe LRU cache of loaded translators bounded by a memory budget.
+
+    Args:
+        max_memory_mb (float): Maximum total size of resident models in MB. 0 disables the cap.
+        loader (callable): Function (model_dir, config) -> translator.
+    """
+
+    def __init__(self, max_memory_mb=0, loader=load_translator):
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+        self.loader = loader
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._configs = {}
+        self._config_locks = {}
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "loads": 0,
+            "evictions": 0,
+            "load_time": 0.0,
+        }
+
+    def get(self, pair, model_dir, config=None, loader=None):
+        """
+        Return the translator for a language pair, loading it on first use.
+
+        Args:
+            pair (str): Language pair such as "en-vi".
+            model_dir (str): Path to the converted model directory.
+            config (dict): Inference settings; read from the environment for the pair when omitted.
+            loader (callable): Overrides the registry's loader for this model.
+
+        Returns:
+            TranslatorCT2fromHfHub: The resident translator.
+        """
+        if config is None:
+            config = self._config(pair, model_dir)
+        key = (pair, config["device"], config["compute_type"])
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                self._models.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[0]
+            self._stats["misses"] += 1
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Only one thread loads a given model; the others wait and reuse it
+        with load_lock:
+            with self._lock:
+                entry = self._models.get(key)
+                if entry is not None:
+                    self._models.move_to_end(key)
+                    return entry[0]
+
+            start_time = time.time()
+            model = metrics.instrument_translator((loader or self.loader)(model_dir, config), pair)
+            load_time = time.time() - start_time
+            metrics.MODEL_LOADS.labels(model=pair).inc()
+            metrics.MODEL_LOAD_SECONDS.labels(model=pair).observe(load_time)
+            size = estimate_model_size(model_dir)
+            print(f"Loaded model {key} in {load_time:.2f} seconds ({size / 1024 / 1024:.0f} MB)")
+
+            with self._lock:
+                self._models[key] = (model, size)
+                self._stats["loads"] += 1
+                self._stats["load_time"] += load_time
+                self._evict(keep=key)
+                metrics.RESIDENT_MODELS.set(len(self._models))
+        return model
+
+    def _config(self, pair, model_dir):
+        # Settings are resolved once per model key, not on every decode; calibration (which loads
+        # the model once per candidate layout) runs under a per-key lock, so only one thread does it
+        config = self._configs.get(pair)
+        if config is not None:
+            return config
+        with self._lock:
+            config_lock = self._config_locks.setdefault(pair, threading.Lock())
+        with config_lock:
+            config = self._configs.get(pair)
+            if config is None:
+                config = get_inference_config(pair, model_dir)
+                self._configs[pair] = config
+        return config
+
+    def _evict(self, keep):
+        # Caller holds self._lock
+        if not self.max_memory_bytes:
+            return
+        while self._resident_bytes() > self.max_memory_bytes and len(self._models) > 1:
+            key = next(k for k in self._models if k != keep)
+            del self._models[key]
+            self._stats["evictions"] += 1
+            metrics.MODEL_EVICTIONS.labels(model=key[0]).inc()
+            print(f"Evicted model {key}")
+
+    def _resident_bytes(self):
+        return sum(size for _, size in self._models.values())
+
+    def clear(self):
+        """Drop every resident model."""
+        with self._lock:
+            self._models.clear()
+            metrics.RESIDENT_MODELS.set(0)
+
+    def stats(self):
+        """
+        Return cache statistics.
+
+        Returns:
+            dict: Hit/miss/load counters, hit rate, total load time and resident models.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+            stats["resident_mb"] = self._resident_bytes() / 1024 / 1024
+            stats["resident_models"] = ["/".join(key) for key in self._models]
+        return stats
+
+
+# Shared registry used by the API, the SQS worker and the batch book translator
+registry = TranslatorRegistry(max_memory_mb=float(os.getenv("MODEL_CACHE_MAX_MB", "0")))
+
+
+def get_translator(pair, model_dir, config=None, loader=None):
+    """Return the shared translator for a language pair."""
+    return registry.get(pair, model_dir, config=config, loader=loader)